@@ -0,0 +1,156 @@
+''' End-to-end crawl benchmark against the local stub cache server.
+
+    python -m benchmarks.crawl_benchmark --pages 2000 --threads 8
+    python -m benchmarks.crawl_benchmark --output run.json
+    python -m benchmarks.crawl_benchmark --baseline run.json
+
+Starts benchmarks.stub_server in another process, runs the full crawler
+on a fresh save file, and prints pages per second, p50/p99 latency of
+every timed stage and peak RSS. --output saves the results; --baseline
+compares against saved results and exits with status 1 when pages per
+second dropped by more than --tolerance.
+'''
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from configparser import ConfigParser
+from contextlib import redirect_stdout
+from io import StringIO
+
+from benchmarks import stub_server
+from utils.config import Config
+from utils.metrics import metrics
+
+
+def get_parser():
+    parser = stub_server.get_parser()
+    parser.description = "Crawl the stub cache server and report throughput."
+    parser.add_argument("--config_file", default="config.ini")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument(
+        "--max_threads", type=int, default=0,
+        help="let the supervisor resize the pool between 1 and this")
+    parser.add_argument("--parse_processes", type=int, default=0)
+    parser.add_argument("--politeness", type=float, default=0.0)
+    parser.add_argument("--output", help="write the results to this json file")
+    parser.add_argument("--baseline", help="compare with results saved by --output")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.set_defaults(port=9099, pages=2000)
+    return parser
+
+
+def make_config(args, save_file):
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    local = cparser["LOCAL PROPERTIES"]
+    local["SAVE"] = save_file
+    local["THREADCOUNT"] = str(args.threads)
+    local["CONCURRENCY"] = str(args.threads)
+    local["MINTHREADS"] = str(1 if args.max_threads else args.threads)
+    local["MAXTHREADS"] = str(args.max_threads or args.threads)
+    local["SCALEINTERVAL"] = "1"
+    local["PARSEPROCESSES"] = str(args.parse_processes)
+    local["METRICSFILE"] = ""
+    local["METRICSPORT"] = "0"
+    cparser["CRAWLER"]["POLITENESS"] = str(args.politeness)
+    cparser["CRAWLER"]["SEEDURL"] = ",".join(
+        f"https://{host}" for host in stub_server.HOSTS[:4])
+    config = Config(cparser)
+    config.cache_server = (args.host, args.port)
+    return config
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux; parse processes count separately.
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024, children / 1024
+
+
+def run(args):
+    server = multiprocessing.get_context("spawn").Process(
+        target=stub_server.serve,
+        args=(args.host, args.port, stub_server.make_site(args),
+              args.latency, args.jitter),
+        daemon=True)
+    server.start()
+    time.sleep(1)
+    # One log line per download would dominate the run.
+    logging.disable(logging.INFO)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            config = make_config(args, os.path.join(directory, "frontier.db"))
+            if args.engine == "async":
+                from crawler.async_crawler import AsyncCrawler
+                crawler = AsyncCrawler(config, True)
+            else:
+                from crawler import Crawler
+                crawler = Crawler(config, True)
+            start = time.perf_counter()
+            with redirect_stdout(StringIO()):
+                crawler.start()
+            elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        logging.disable(logging.NOTSET)
+    snapshot = metrics.snapshot()
+    pages = snapshot["counters"].get("pages", 0)
+    own_rss, children_rss = peak_rss_mb()
+    return {
+        "engine": args.engine, "threads": args.threads,
+        "max_threads": args.max_threads,
+        "resized": snapshot["counters"].get("workers.resized", 0),
+        "trap_urls": sum(
+            snapshot["counters"].get(name, 0)
+            for name in ("traps.rejected", "traps.skipped")),
+        "parse_processes": args.parse_processes, "pages": pages,
+        "seconds": elapsed, "pages_per_second": pages / elapsed,
+        "peak_rss_mb": own_rss, "peak_child_rss_mb": children_rss,
+        "stages": {
+            name: {"count": timer["count"], "p50": timer["p50"], "p99": timer["p99"]}
+            for name, timer in sorted(snapshot["timers"].items())}}
+
+
+def print_results(results):
+    print(f"{results['pages']} pages in {results['seconds']:.2f}s, "
+          f"{results['pages_per_second']:.1f} pages/s "
+          f"({results['engine']}, {results['threads']} threads, "
+          f"{results['parse_processes']} parse processes)")
+    if results.get("max_threads"):
+        print(f"pool resized {results['resized']} times, up to "
+              f"{results['max_threads']} threads")
+    if results.get("trap_urls"):
+        print(f"{results['trap_urls']} urls of trap templates not crawled")
+    print(f"peak RSS {results['peak_rss_mb']:.1f} MB, "
+          f"largest child {results['peak_child_rss_mb']:.1f} MB")
+    print(f"{'stage':<20}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, stage in results["stages"].items():
+        print(f"{name:<20}{stage['count']:>8}"
+              f"{stage['p50'] * 1000:>10.3f}{stage['p99'] * 1000:>10.3f}")
+
+
+def main():
+    args = get_parser().parse_args()
+    results = run(args)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=1)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        change = results["pages_per_second"] / baseline["pages_per_second"] - 1
+        print(f"pages/s {change:+.1%} against {args.baseline}")
+        if change < -args.tolerance:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
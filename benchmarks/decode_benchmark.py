@@ -0,0 +1,154 @@
+''' Check the download and response decoding path against the original
+one, then compare their CPU time and peak memory on large pages.
+
+    python -m benchmarks.decode_benchmark [--sizes 4,1024,8192] [--downloads 40]
+
+For pages of each size in kB, checks that utils.download.decode and the
+lazy Response give the same url, status, error and content as cbor.loads
+and pickle.loads, for status 200, a 404 and an error without a page.
+Then times decoding a cache server body both ways and measures the peak
+memory it takes. Last, downloads the pages from a stub server in another
+process the original way, requests.get with a new connection and
+resp.content, and with utils.download.download, and reports the client
+CPU time and peak memory per download.
+'''
+import logging
+import multiprocessing
+import pickle
+import random
+import time
+import tracemalloc
+
+from argparse import ArgumentParser
+
+import cbor
+import requests
+
+from benchmarks import stub_server
+from utils.download import decode, download
+from utils.response import Response
+
+
+class FixedSite(object):
+    ''' Serves the same page of `size` kB for every url. '''
+
+    def __init__(self, size):
+        rnd = random.Random(size)
+        words = " ".join(
+            f"{rnd.getrandbits(24):x}" for _ in range(size * 1024 // 7))
+        self.html = f"<html><body><p>{words}</p></body></html>".encode()
+
+    def get(self, url):
+        if url.endswith("/missing"):
+            return 404, b""
+        return 200, self.html
+
+
+def body(url, status, html):
+    raw_response = requests.models.Response()
+    raw_response.status_code = status
+    raw_response.url = url
+    raw_response._content = html
+    return cbor.dumps({
+        "url": url, "status": status, "response": pickle.dumps(raw_response)})
+
+
+def decode_reference(content):
+    ''' What download() did before: cbor.loads, then pickle.loads. '''
+    resp_dict = cbor.loads(content)
+    raw_response = pickle.loads(resp_dict["response"]) if "response" in resp_dict else None
+    return resp_dict, raw_response
+
+
+def download_reference(url, config):
+    host, port = config.cache_server
+    resp = requests.get(
+        f"http://{host}:{port}/",
+        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+    return decode_reference(resp.content)
+
+
+def check(site):
+    bodies = [
+        body("https://www.ics.uci.edu/a", 200, site.html),
+        body("https://www.ics.uci.edu/missing", 404, b""),
+        cbor.dumps({"url": "https://www.ics.uci.edu/b", "status": 600,
+                    "error": "Spacetime Response error"})]
+    for content in bodies:
+        resp_dict, raw_response = decode_reference(content)
+        resp = Response(decode(content))
+        assert (resp.url, resp.status, resp.error) == (
+            resp_dict["url"], resp_dict["status"], resp_dict.get("error"))
+        if raw_response is None:
+            assert resp.raw_response is None
+        else:
+            assert resp.raw_response.content == raw_response.content
+            assert resp.raw_response.url == raw_response.url
+
+
+def measure(function, repeat):
+    ''' (CPU seconds per call, peak traced bytes of one call). '''
+    start = time.process_time()
+    for _ in range(repeat):
+        function()
+    cpu = (time.process_time() - start) / repeat
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return cpu, peak
+
+
+def compare(name, original, new, repeat):
+    old_cpu, old_peak = measure(original, repeat)
+    new_cpu, new_peak = measure(new, repeat)
+    print(f"{name:<22}{old_cpu * 1000:>10.3f}{new_cpu * 1000:>10.3f}"
+          f"{old_peak / 2**20:>11.2f}{new_peak / 2**20:>11.2f}")
+
+
+class BenchmarkConfig(object):
+    user_agent = "IR US24 benchmark"
+
+    def __init__(self, port):
+        self.cache_server = ("127.0.0.1", port)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", default="4,1024,8192")
+    parser.add_argument("--downloads", type=int, default=40)
+    parser.add_argument("--port", type=int, default=9098)
+    args = parser.parse_args()
+    logger = logging.getLogger("BENCHMARK")
+    print(f"{'':<22}{'original':>10}{'new':>10}{'original':>11}{'new':>11}")
+    print(f"{'':<22}{'cpu ms':>10}{'cpu ms':>10}{'peak MB':>11}{'peak MB':>11}")
+    for port, size in enumerate(map(int, args.sizes.split(",")), args.port):
+        site = FixedSite(size)
+        check(site)
+        content = body("https://www.ics.uci.edu/a", 200, site.html)
+        repeat = max(args.downloads, 20000 // size)
+        compare(
+            f"decode {size} kB", lambda: decode_reference(content)[1].content,
+            lambda: Response(decode(content)).raw_response.content, repeat)
+        compare(
+            f"decode {size} kB 404", lambda: decode_reference(content),
+            lambda: Response(decode(content)).status, repeat)
+
+        server = multiprocessing.get_context("spawn").Process(
+            target=stub_server.serve, args=("127.0.0.1", port, site), daemon=True)
+        server.start()
+        time.sleep(1)
+        config = BenchmarkConfig(port)
+        url = "https://www.ics.uci.edu/a"
+        try:
+            compare(
+                f"download {size} kB",
+                lambda: download_reference(url, config)[1].content,
+                lambda: download(url, config, logger).raw_response.content,
+                args.downloads)
+        finally:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
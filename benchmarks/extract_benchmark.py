@@ -0,0 +1,72 @@
+''' Compare utils.html_extract with the BeautifulSoup path it replaced.
+
+    python -m benchmarks.extract_benchmark path/to/pages
+
+Every file under the directory is read as one raw page. The script fails
+if the streaming extractor disagrees with BeautifulSoup on any page, then
+prints the time and peak traced memory of both.
+'''
+import os
+import time
+import tracemalloc
+
+from argparse import ArgumentParser
+
+from bs4 import BeautifulSoup
+
+from utils.html_extract import extract, ExtractedPage
+
+
+def extract_with_soup(html):
+    soup = BeautifulSoup(html, 'lxml')
+    robots_meta_tag = soup.find("meta", {"name": "robots"})
+    if robots_meta_tag:
+        content = robots_meta_tag.get("content")
+        if content is not None and "nofollow" in content.split(','):
+            return ExtractedPage(True, None, None)
+    hrefs = [link.get('href') for link in soup.find_all('a', href=True)]
+    return ExtractedPage(False, soup.get_text(), hrefs)
+
+
+def load_pages(directory):
+    pages = list()
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            with open(path, "rb") as page:
+                pages.append((path, page.read()))
+    return pages
+
+
+def measure(function, pages):
+    tracemalloc.start()
+    start = time.perf_counter()
+    results = [function(html) for _, html in pages]
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return results, elapsed, peak
+
+
+def main(directory):
+    pages = load_pages(directory)
+    total_bytes = sum(len(html) for _, html in pages)
+    print(f"{len(pages)} pages, {total_bytes / 2**20:.1f} MiB")
+
+    for (path, html) in pages:
+        expected, actual = extract_with_soup(html), extract(html)
+        assert actual == expected, f"Extractor output differs on {path}"
+    print("Links and text identical on every page.")
+
+    for name, function in (("BeautifulSoup", extract_with_soup),
+                           ("streaming", extract)):
+        _, elapsed, peak = measure(function, pages)
+        print(f"{name:>13}: {elapsed:.2f}s, {len(pages) / elapsed:.1f} pages/s, "
+              f"peak {peak / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("directory", type=str)
+    args = parser.parse_args()
+    main(args.directory)
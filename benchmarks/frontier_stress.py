@@ -0,0 +1,200 @@
+''' Crawl a synthetic site with many threads against one Frontier, without
+    a network, and check that no url is lost or handed out twice.
+
+    python -m benchmarks.frontier_stress [--threads 32] [--urls 20000] [--links 8]
+
+Every page is on one of the stub server hosts, and its links and content
+follow from its number. One page in ten has no links and shares its
+content with other such pages, so threads race on the duplicate checks.
+With POLITENESS 0 the workers only contend on the frontier, and threads
+switch far more often than usual so that races show. Checks that every
+reachable url was handed out exactly once and is complete in the save
+file, and that the unique page, duplicate, word, subdomain and longest
+page analytics are what crawling the same urls one at a time gives.
+'''
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser
+from collections import Counter, deque
+from hashlib import sha256
+from threading import Thread, Lock
+from urllib.robotparser import RobotFileParser
+
+from benchmarks import stub_server
+from benchmarks.resume_benchmark import make_config
+from crawler.frontier import Frontier
+from crawler.report import summarize
+from crawler.store import FrontierStore
+from utils.metrics import metrics
+import scraper
+
+# Pages whose number is a multiple of this are duplicates without links.
+DUPLICATE_EVERY = 10
+DUPLICATE_GROUPS = 20
+VOCABULARY = 500
+
+
+def page_url(number):
+    host = stub_server.HOSTS[number % len(stub_server.HOSTS)]
+    return f"https://{host}/p/{number}"
+
+
+def page_number(url):
+    return int(url.rsplit("/", 1)[1])
+
+
+class Site(object):
+    ''' The synthetic site: links and content of every page. '''
+
+    def __init__(self, urls, links):
+        self.urls = urls
+        self.links = links
+
+    def content(self, number):
+        ''' Content id of a page, shared by the pages of a duplicate group. '''
+        if number % DUPLICATE_EVERY:
+            return number
+        return -1 - number // DUPLICATE_EVERY % DUPLICATE_GROUPS
+
+    def out_links(self, number):
+        if not number % DUPLICATE_EVERY:
+            return []
+        rnd = random.Random(number)
+        return [page_url(rnd.randrange(self.urls)) for _ in range(self.links)]
+
+    def words(self, content):
+        rnd = random.Random(str(content))
+        return {
+            f"w{word}": 1 + content % 3
+            for word in rnd.sample(range(VOCABULARY), 20)}
+
+    def page(self, number):
+        content = self.content(number)
+        return scraper.Page(
+            nofollow=False,
+            content_hash=sha256(str(content).encode()).hexdigest(),
+            simhash=random.Random(str(content)).getrandbits(64),
+            text_length=1000, html_length=2000,
+            word_count=content * 7919 % 100003,
+            word_freq=self.words(content),
+            links=self.out_links(number))
+
+    def reachable(self, seeds):
+        ''' Urls reachable from the seeds, breadth first. '''
+        found = set(seeds)
+        queue = deque(seeds)
+        while queue:
+            for link in self.out_links(page_number(queue.popleft())):
+                if link not in found:
+                    found.add(link)
+                    queue.append(link)
+        return found
+
+
+def expected(site, urls):
+    ''' Analytics of crawling `urls`, computed one page at a time. '''
+    contents = {site.content(page_number(url)) for url in urls}
+    words = Counter()
+    for content in contents:
+        words.update(site.words(content))
+    subdomains = Counter(
+        scraper.root(url).lower() for url in urls
+        if scraper.is_subdomain_of("ics.uci.edu", url))
+    return {
+        "unique_pages": len(urls),
+        "duplicates": len(urls) - len(contents),
+        "max_words": max(content * 7919 % 100003 for content in contents),
+        "words": dict(words),
+        "subdomains": dict(subdomains)}
+
+
+def work(frontier, site, fetched, lock):
+    while True:
+        url = frontier.get_tbd_url()
+        if url is None:
+            return
+        with lock:
+            fetched[url] += 1
+        links = scraper.merge_page(url, site.page(page_number(url)), frontier)
+        for link in links:
+            frontier.add_url(link, url)
+        frontier.mark_url_complete(url)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", default="config.ini")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--urls", type=int, default=20000)
+    parser.add_argument("--links", type=int, default=8)
+    parser.add_argument(
+        "--switch_interval", type=float, default=1e-6,
+        help="seconds between thread switches, 0.005 by default in Python")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    sys.setswitchinterval(args.switch_interval)
+    site = Site(args.urls, args.links)
+    seeds = [page_url(number) for number in range(1, 5)]
+    with tempfile.TemporaryDirectory() as directory:
+        config = make_config(args.config_file, os.path.join(directory, "frontier.db"))
+        config.time_delay = 0.0
+        config.seed_urls = []
+        frontier = Frontier(config, True)
+        allow_all = RobotFileParser()
+        allow_all.allow_all = True
+        for host in stub_server.HOSTS:
+            frontier.robots.rules[host] = (float("inf"), allow_all)
+        for url in seeds:
+            frontier.add_url(url)
+
+        fetched = Counter()
+        lock = Lock()
+        workers = [
+            Thread(target=work, args=(frontier, site, fetched, lock))
+            for _ in range(args.threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        summary = summarize(frontier, all_words=True)
+        summary["words"] = dict(summary["words"])
+        summary["duplicates"] = metrics.snapshot()["counters"].get("duplicates", 0)
+        frontier.close()
+        store = FrontierStore(config.save_file)
+        completed = {record.url for record in store.values() if record.completed}
+        store.close()
+
+    reachable = site.reachable(seeds)
+    reference = expected(site, reachable)
+    twice = [url for url, count in fetched.items() if count > 1]
+    lost = reachable - set(fetched)
+    print(f"{len(fetched)} urls with {args.threads} threads in {elapsed:.2f}s "
+          f"({len(fetched) / elapsed:.0f} urls/s)")
+    failures = list()
+    if twice:
+        failures.append(f"{len(twice)} urls handed out more than once, e.g. {twice[0]}")
+    if lost:
+        failures.append(f"{len(lost)} reachable urls never handed out")
+    if completed != reachable:
+        failures.append(
+            f"{len(reachable - completed)} urls not complete in the save file")
+    for key, value in reference.items():
+        if summary[key] != value:
+            failures.append(f"{key} differs from crawling one page at a time")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: every url handed out once, analytics match")
+    return failures
+
+
+if __name__ == "__main__":
+    if main():
+        raise SystemExit(1)
@@ -0,0 +1,144 @@
+''' Check scraper.extract_links against the original per-link filtering
+and time both.
+
+    python -m benchmarks.links_benchmark [--pages 300] [--links 400]
+
+Pages are generated with link-heavy navigation: repeated menu links,
+relative and protocol-relative hrefs, queries, fragments, file
+extensions, foreign and look-alike domains, ports, odd schemes and
+malformed urls. The script fails if any page gets a different link list.
+'''
+import random
+import re
+import time
+
+from argparse import ArgumentParser
+from urllib.parse import urlparse, urljoin, urlunparse
+
+import scraper
+
+
+def is_valid_reference(url):
+    parsed = urlparse(url)
+    if parsed.scheme not in set(["http", "https"]):
+        return False
+
+    return not re.match(
+        r".*\.(css|js|bmp|gif|jpe?g|ico"
+        + r"|png|tiff?|mid|mp2|mp3|mp4"
+        + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+        + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+        + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+        + r"|epub|dll|cnf|tgz|sha1"
+        + r"|thmx|mso|arff|rtf|jar|csv"
+        + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower()) and valid_domain_reference(url)
+
+
+def valid_domain_reference(url):
+    valid_domains = {'ics.uci.edu',
+                    'cs.uci.edu',
+                    'informatics.uci.edu',
+                    'stat.uci.edu'}
+
+    parsed_url = urlparse(url)
+    domain = parsed_url.netloc.split('.')
+    if len(domain) < 3:
+        return False
+    domain = '.'.join(domain[-3:])
+    return domain in valid_domains
+
+
+def extract_links_reference(url, hrefs):
+    link_urls = []
+    for link in hrefs:
+        link = link.strip()
+        if not link or link[0] == '#':
+            pass
+        elif link.startswith('//'):
+            link = 'https:' + link
+        elif link.startswith('/'):
+            link = urljoin(url, link)
+        try:
+            link = urlunparse(urlparse(link)._replace(fragment='',query=''))
+        except ValueError:
+            continue
+        if is_valid_reference(link) and not scraper.urls_differ_by_at_most_n_chars(2, url, link) and not scraper.has_too_many_slashes(link, 12):
+            link_urls.append(link)
+    return link_urls
+
+
+HOSTS = [
+    "www.ics.uci.edu", "vision.ics.uci.edu", "www.cs.uci.edu",
+    "www.informatics.uci.edu", "www.stat.uci.edu", "WWW.ICS.UCI.EDU",
+    "www.ics.uci.edu:8080", "uci.edu", "ics.uci.edu", "evil.com",
+    "ics.uci.edu.evil.com", "www.physics.uci.edu", "user@www.cs.uci.edu"]
+SPECIAL = [
+    "", " ", "#", "#top", "mailto:someone@ics.uci.edu", "javascript:void(0)",
+    "tel:+1949", "ftp://www.ics.uci.edu/pub", "http:////www.ics.uci.edu/a",
+    "https:///www.cs.uci.edu/b", "http:www.ics.uci.edu/c", "http://[::1",
+    "http://[fe80::1]/x", "HTTP://WWW.ICS.UCI.EDU/Upper", "//", "///x",
+    "https://www.ics.uci.edu/a\nb/page", "\t/indented ", "?query=only",
+    "relative/page.html", "../up/one", "/a;params/b;p?q=1#f",
+    "https://www.ics.uci.edu/" + "deep/" * 12, "https://www.ics.uci.edu/x.PDF",
+    "https://www.ics.uci.edu/x.pdf?download=1", "https://www.ics.uci.edu/x.pdf/"]
+EXTENSIONS = ["", ".html", ".php", ".pdf", ".jpg", ".css", ".txt", ".tar.gz", ".JPEG"]
+
+
+def random_href(rnd):
+    kind = rnd.random()
+    if kind < 0.1:
+        return rnd.choice(SPECIAL)
+    path = "/".join(
+        rnd.choice(["about", "people", "research", "~user", "events", "2020",
+                    "wiki", "news", "a", "b"])
+        for _ in range(rnd.randrange(1, 5))) + rnd.choice(EXTENSIONS)
+    if rnd.random() < 0.3:
+        path += rnd.choice(["?page=2", "#section", "?a=1&b=2#c", "?"])
+    if kind < 0.4:
+        return "/" + path
+    if kind < 0.5:
+        return f"//{rnd.choice(HOSTS)}/{path}"
+    return f"{rnd.choice(['http', 'https'])}://{rnd.choice(HOSTS)}/{path}"
+
+
+def make_pages(count, links, seed=0):
+    rnd = random.Random(seed)
+    pages = list()
+    for _ in range(count):
+        url = f"https://{rnd.choice(HOSTS[:5])}/{rnd.choice(['', 'about', 'people/x'])}"
+        # Navigation repeats on every page, content links do not.
+        menu = [random_href(rnd) for _ in range(links // 4)]
+        hrefs = menu + [random_href(rnd) for _ in range(links // 2)] + menu
+        pages.append((url, hrefs))
+    return pages
+
+
+def measure(function, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [function(url, hrefs) for url, hrefs in pages]
+    return results, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--links", type=int, default=400)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = make_pages(args.pages, args.links)
+    pages.append(("https://www.ics.uci.edu/about", SPECIAL))
+    expected, reference_time = measure(extract_links_reference, pages, args.repeat)
+    actual, new_time = measure(scraper.extract_links, pages, args.repeat)
+    for (url, _), want, got in zip(pages, expected, actual):
+        assert want == got, f"Link lists differ on {url}: {want} != {got}"
+    kept = sum(len(links) for links in expected)
+    total = sum(len(hrefs) for _, hrefs in pages)
+    print(f"{len(pages)} pages, {total} hrefs, {kept} kept: identical results")
+    print(f"reference:     {reference_time:.3f}s")
+    print(f"extract_links: {new_time:.3f}s ({reference_time / new_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+''' Time resuming a crawl with a long history.
+
+    python -m benchmarks.resume_benchmark [--urls 1000000] [--pending 0.1]
+
+Writes a save file with --urls rows, of which the --pending fraction is
+not crawled yet, and the fingerprint logs and seen set a crawl of that
+size leaves behind. Then times opening the frontier and getting the
+first url, next to a full scan of the save file, which is what resuming
+used to cost before any url could be crawled, and reports when the
+SimHash index, which is rebuilt in the background, is complete.
+'''
+import logging
+import os
+import random
+import tempfile
+import time
+
+from argparse import ArgumentParser
+from array import array
+from configparser import ConfigParser
+from contextlib import redirect_stdout
+from hashlib import sha256
+from io import StringIO
+
+from benchmarks import stub_server
+from crawler.frontier import Frontier
+from crawler.store import FrontierStore, UrlRecord
+from utils import get_urlhash
+from utils.config import Config
+from utils.url_seen import UrlSeenSet
+from scraper import is_valid
+
+
+def make_config(config_file, save_file):
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    cparser["LOCAL PROPERTIES"]["SAVE"] = save_file
+    cparser["LOCAL PROPERTIES"]["METRICSFILE"] = ""
+    with redirect_stdout(StringIO()):
+        return Config(cparser)
+
+
+def make_history(config, urls, pending, seed=0):
+    rnd = random.Random(seed)
+    store = FrontierStore(config.save_file, flush_size=100000)
+    completed = 0
+    for i in range(urls):
+        url = f"https://{stub_server.HOSTS[i % len(stub_server.HOSTS)]}/p/{i}"
+        done = rnd.random() >= pending
+        completed += done
+        store[get_urlhash(url)] = UrlRecord(
+            url, done, -rnd.random() * 10, rnd.randrange(10),
+            sha256(url.encode()).hexdigest() if done else None,
+            time.time() if done else None, 86400 if done else None)
+    store.close()
+    hashes = b"".join(
+        sha256(str(i).encode()).digest()[:16] for i in range(completed))
+    with open(f"{config.save_file}.hashes", "wb") as log:
+        log.write(hashes)
+    with open(f"{config.save_file}.simhash", "wb") as log:
+        array("Q", (rnd.getrandbits(64) for _ in range(completed))).tofile(log)
+    store = FrontierStore(config.save_file)
+    seen = UrlSeenSet(f"{config.save_file}.seen")
+    seen.rebuild(store.keys())
+    seen.close()
+    store.close()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", default="config.ini")
+    parser.add_argument("--urls", type=int, default=1000000)
+    parser.add_argument("--pending", type=float, default=0.1)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as directory:
+        config = make_config(args.config_file, os.path.join(directory, "frontier.db"))
+        start = time.perf_counter()
+        make_history(config, args.urls, args.pending)
+        print(f"wrote {args.urls} urls in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        store = FrontierStore(config.save_file)
+        pending = sum(
+            1 for record in store.values()
+            if not record.completed and is_valid(record.url))
+        store.close()
+        print(f"full scan:    {time.perf_counter() - start:.2f}s "
+              f"({pending} urls to crawl)")
+
+        start = time.perf_counter()
+        frontier = Frontier(config, False)
+        ready = time.perf_counter() - start
+        url, _ = frontier.try_get_tbd_url()
+        first = time.perf_counter() - start
+        print(f"resume:       {ready:.2f}s to open, {first:.2f}s to the first url "
+              f"({frontier.tbd_count} queued, {len(frontier.fingerprints)} "
+              f"hashes and {len(frontier.sim_fingerprints)} simhashes)")
+        frontier.sim_fingerprints.loaded.wait()
+        print(f"simhash index rebuilt in the background after "
+              f"{time.perf_counter() - start:.2f}s")
+        frontier.release_url(url)
+        frontier.close()
+
+
+if __name__ == "__main__":
+    main()
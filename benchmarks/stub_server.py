@@ -0,0 +1,208 @@
+''' Local stand-in for the spacetime cache server.
+
+    python -m benchmarks.stub_server --port 9000 --pages 5000 --latency 0.05
+    python3 launch.py --restart --cache_server 127.0.0.1:9000
+
+Speaks the same protocol as the real cache: GET /?q=<url>&u=<useragent>
+returns a CBOR dict with url, status and the pickled requests.Response as
+"response". Pages come from a deterministic synthetic site, or from a
+recorded one (a directory with an index.json mapping urls to files), and
+every request can be delayed to imitate the network.
+'''
+import json
+import os
+import pickle
+import random
+import time
+
+from argparse import ArgumentParser
+from hashlib import sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import accumulate
+from urllib.parse import urlparse, parse_qs
+
+import cbor
+import requests
+
+HOSTS = [
+    "www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu",
+    "www.stat.uci.edu", "vision.ics.uci.edu", "ngs.ics.uci.edu",
+    "sdcl.ics.uci.edu", "wics.ics.uci.edu"]
+# Links on every event page of a --trap site.
+TRAP_LINKS = 5
+
+
+def _host_path(url):
+    parsed = urlparse(url)
+    return parsed.netloc.lower(), parsed.path.rstrip("/")
+
+
+class SyntheticSite(object):
+    ''' `pages` pages spread over HOSTS. Every page has Zipf distributed
+    words and `links` links to other pages; the root of each host links
+    to `links` pages of that host. With `disallow`, every host's
+    robots.txt disallows paths starting with it. With `trap`, every root
+    also links to an endless tree of event pages that link to TRAP_LINKS
+    more each, two in three of them near duplicates of each other. The
+    same seed gives the same site. '''
+
+    def __init__(self, pages=5000, links=20, words=400, vocabulary=5000,
+                 seed=0, disallow=None, trap=False):
+        self.pages = pages
+        self.disallow = disallow
+        self.trap = trap
+        self.links = links
+        self.words = words
+        self.seed = seed
+        self.vocabulary = [
+            sha1(f"{seed}-{i}".encode()).hexdigest()[:4 + i % 6]
+            for i in range(vocabulary)]
+        self.cum_weights = list(accumulate(1 / rank for rank in range(1, vocabulary + 1)))
+        self.page_ids = {
+            _host_path(self.url(page_id)): page_id for page_id in range(pages)}
+
+    def url(self, page_id):
+        slug = sha1(f"{self.seed}/{page_id}".encode()).hexdigest()[:12]
+        return f"https://{HOSTS[page_id % len(HOSTS)]}/p/{slug}"
+
+    def event_url(self, host, event):
+        slug = sha1(f"{self.seed}/event/{event}".encode()).hexdigest()[:8]
+        return f"https://{host}/events/{slug}-{event}"
+
+    def _page(self, rnd, link_ids, events=(), heading=""):
+        words = " ".join(rnd.choices(
+            self.vocabulary, cum_weights=self.cum_weights, k=self.words))
+        links = "".join(
+            f'<li><a href="{self.url(link_id)}">{link_id}</a></li>'
+            for link_id in link_ids)
+        links += "".join(f'<li><a href="{url}">events</a></li>' for url in events)
+        return (
+            f"<html><head><title>Page</title></head><body>"
+            f"<p>{heading}{words}</p><ul>{links}</ul></body></html>").encode()
+
+    def get(self, url):
+        ''' (status, html) for a url. '''
+        host, path = _host_path(url)
+        if path == "/robots.txt" and self.disallow:
+            return 200, f"User-agent: *\nDisallow: {self.disallow}\n".encode()
+        page_id = self.page_ids.get((host, path))
+        if page_id is not None:
+            rnd = random.Random(f"{self.seed}/{page_id}")
+            link_ids = [rnd.randrange(self.pages) for _ in range(self.links)]
+            return 200, self._page(rnd, link_ids)
+        if path == "" and host in HOSTS:
+            rnd = random.Random(f"{self.seed}/{host}")
+            first = HOSTS.index(host)
+            link_ids = [
+                first + len(HOSTS) * rnd.randrange(self.pages // len(HOSTS))
+                for _ in range(self.links)]
+            events = [self.event_url(host, 0)] if self.trap else []
+            return 200, self._page(rnd, link_ids, events)
+        event = path.rsplit("-", 1)[-1]
+        if self.trap and path.startswith("/events/") and event.isdigit():
+            event = int(event)
+            # One event page in three has its own words, so the tree keeps
+            # growing; the others differ from each other only in the heading.
+            rnd = random.Random(
+                f"{self.seed}/events" if event % 3 else f"{self.seed}/event/{event}")
+            return 200, self._page(rnd, [], [
+                self.event_url(host, event * TRAP_LINKS + i)
+                for i in range(1, TRAP_LINKS + 1)], f"Event {event} ")
+        return 404, b""
+
+
+class RecordedSite(object):
+    ''' Pages saved to disk. `directory`/index.json maps each url to a
+    file in the directory; urls that are not listed are 404. '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "index.json")) as index:
+            self.files = {
+                _host_path(url): filename
+                for url, filename in json.load(index).items()}
+
+    def get(self, url):
+        filename = self.files.get(_host_path(url))
+        if filename is None:
+            return 404, b""
+        with open(os.path.join(self.directory, filename), "rb") as page:
+            return 200, page.read()
+
+
+def _handler(site, latency, jitter):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are separate writes; with Nagle's algorithm a
+        # kept-alive connection would wait for a delayed ACK between them.
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            url = query.get("q", [""])[0]
+            if latency or jitter:
+                time.sleep(latency + random.uniform(0, jitter))
+            status, html = site.get(url)
+            raw_response = requests.models.Response()
+            raw_response.status_code = status
+            raw_response.url = url
+            raw_response._content = html
+            body = cbor.dumps({
+                "url": url, "status": status,
+                "response": pickle.dumps(raw_response)})
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+
+def make_server(host, port, site, latency=0.0, jitter=0.0):
+    server = ThreadingHTTPServer((host, port), _handler(site, latency, jitter))
+    server.daemon_threads = True
+    return server
+
+
+def serve(host, port, site, latency=0.0, jitter=0.0):
+    make_server(host, port, site, latency, jitter).serve_forever()
+
+
+def get_parser():
+    parser = ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--links", type=int, default=20)
+    parser.add_argument("--words", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--disallow", help="path prefix every robots.txt disallows")
+    parser.add_argument(
+        "--trap", action="store_true",
+        help="add an endless tree of near duplicate event pages to every host")
+    parser.add_argument(
+        "--recorded", help="serve the pages in this directory instead")
+    parser.add_argument(
+        "--latency", type=float, default=0.0,
+        help="seconds added to every request")
+    parser.add_argument(
+        "--jitter", type=float, default=0.0,
+        help="up to this many more seconds, chosen at random")
+    return parser
+
+
+def make_site(args):
+    if args.recorded:
+        return RecordedSite(args.recorded)
+    return SyntheticSite(
+        args.pages, args.links, args.words, seed=args.seed,
+        disallow=args.disallow, trap=args.trap)
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    print(f"Serving on {args.host}:{args.port}")
+    serve(args.host, args.port, make_site(args), args.latency, args.jitter)
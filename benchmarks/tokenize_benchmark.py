@@ -0,0 +1,116 @@
+''' Check scraper.tokenize and computeWordFrequencies against the original
+per-character implementation and time both.
+
+    python -m benchmarks.tokenize_benchmark [--pages 200] [--words 20000]
+
+Pages are generated with mixed case, digits, apostrophes, punctuation,
+non-ASCII letters and short trailing tokens. With NumPy installed a
+byte-level tokenizer is timed as well for comparison.
+'''
+import random
+import time
+
+from argparse import ArgumentParser
+
+import scraper
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def tokenize_reference(text_content):
+    tokens = []
+    token = ""
+    for char in text_content:
+        char = char.lower()
+        if (ord(char)>=97 and ord(char)<=122) or (ord(char)>=48 and ord(char)<=57) or ord(char)==39:
+            token += char
+        elif len(token)>=3:
+            tokens.append(token)
+            token = ""
+        else:
+            token = ""
+    if token:
+        tokens.append(token)
+    return tokens
+
+
+def word_frequencies_reference(tokens):
+    freq = {}
+    for token in tokens:
+        if not token in scraper.stopwords:
+            freq[token] = 1 + freq.get(token, 0)
+    return freq
+
+
+def tokenize_numpy(text_content):
+    ''' Byte-level variant: classify every byte with a lookup table and
+    slice the token runs out of the lowered text. ASCII text only. '''
+    data = numpy.frombuffer(text_content.lower().encode("ascii"), numpy.uint8)
+    table = numpy.zeros(256, bool)
+    table[list(b"abcdefghijklmnopqrstuvwxyz0123456789'")] = True
+    edges = numpy.diff(numpy.concatenate(([False], table[data], [False])).astype(numpy.int8))
+    starts = numpy.flatnonzero(edges == 1).tolist()
+    ends = numpy.flatnonzero(edges == -1).tolist()
+    text = data.tobytes().decode("ascii")
+    tokens = [text[start:end] for start, end in zip(starts, ends) if end - start >= 3]
+    if ends and ends[-1] == len(text) and ends[-1] - starts[-1] < 3:
+        tokens.append(text[starts[-1]:])
+    return tokens
+
+
+def generate_pages(count, words):
+    rng = random.Random(0)
+    vocabulary = (list(scraper.stopwords)[:60] +
+                  ["Crawler", "INDEX", "it's", "don't", "o'clock", "'tis", "rock'n'roll",
+                   "2019", "x86", "a1", "UCI", "ICS", "data-set", "e-mail", "café",
+                   "naïve", "\u212aelvin", "straße", "über", "中文"])
+    separators = [" ", " ", " ", "\n", "\t", ", ", ". ", "! ", "(", ")", "--", " "]
+    pages = list()
+    for _ in range(count):
+        parts = [rng.choice(vocabulary) + rng.choice(separators) for _ in range(words)]
+        # Short tokens at the very end are kept by the original rules.
+        parts.append(rng.choice(["", "ab", "x", "'", "abc", " "]))
+        pages.append("".join(parts))
+    return pages
+
+
+def timed(function, pages):
+    start = time.perf_counter()
+    for page in pages:
+        function(page)
+    return time.perf_counter() - start
+
+
+def main(page_count, words):
+    pages = generate_pages(page_count, words)
+    for page in pages:
+        tokens = scraper.tokenize(page)
+        assert tokens == tokenize_reference(page), "Token lists differ"
+        assert scraper.computeWordFrequencies(tokens) == word_frequencies_reference(tokens), \
+            "Word frequencies differ"
+    print(f"Tokens and frequencies identical on {len(pages)} pages.")
+
+    candidates = [("reference", lambda page: word_frequencies_reference(tokenize_reference(page))),
+                  ("regex", lambda page: scraper.computeWordFrequencies(scraper.tokenize(page)))]
+    if numpy is not None:
+        ascii_pages = [page.encode("ascii", "ignore").decode("ascii") for page in pages]
+        for page in ascii_pages:
+            assert tokenize_numpy(page) == tokenize_reference(page), "NumPy tokens differ"
+        candidates.append(("numpy", lambda page: scraper.computeWordFrequencies(tokenize_numpy(page))))
+    else:
+        ascii_pages = None
+
+    for name, function in candidates:
+        elapsed = timed(function, ascii_pages if name == "numpy" else pages)
+        print(f"{name:>9}: {elapsed:.3f}s, {len(pages) / elapsed:.1f} pages/s")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--words", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.pages, args.words)
@@ -1,6 +1,10 @@
 from utils import get_logger
+from utils.metrics import start_reporter
 from crawler.frontier import Frontier
 from crawler.worker import Worker
+from crawler.report import print_report
+from crawler.pipeline import ParsePipeline
+from crawler.supervisor import WorkerSupervisor
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
@@ -9,18 +13,51 @@ class Crawler(object):
         self.frontier = frontier_factory(config, restart)
         self.workers = list()
         self.worker_factory = worker_factory
+        self.worker_args = dict()
+        self.pipeline = None
+        self.supervisor = None
+        self.reporter = None
 
     def start_async(self):
-        self.workers = [
-            self.worker_factory(worker_id, self.config, self.frontier)
-            for worker_id in range(self.config.threads_count)]
-        for worker in self.workers:
-            worker.start()
+        self.reporter = start_reporter(self.config, self.logger)
+        if self.config.parse_processes:
+            self.pipeline = ParsePipeline(self.config, self.frontier)
+            self.worker_args["pipeline"] = self.pipeline
+        threads_count = max(
+            self.config.min_threads,
+            min(self.config.max_threads, self.config.threads_count))
+        for _ in range(threads_count):
+            self.add_worker()
+        if self.config.max_threads > self.config.min_threads:
+            self.supervisor = WorkerSupervisor(self)
+            self.supervisor.start()
+
+    def add_worker(self):
+        worker = self.worker_factory(
+            len(self.workers), self.config, self.frontier, **self.worker_args)
+        self.workers.append(worker)
+        worker.start()
 
     def start(self):
         self.start_async()
         self.join()
 
     def join(self):
+        self.stop()
+        print_report(self.frontier)
+
+    def stop(self):
+        ''' Wait for the workers and close everything they used. '''
+        # The supervisor may start workers until the frontier is finished.
+        while any(worker.is_alive() for worker in self.workers):
+            for worker in list(self.workers):
+                worker.join()
+        if self.supervisor:
+            self.supervisor.stop()
         for worker in self.workers:
             worker.join()
+        if self.pipeline:
+            self.pipeline.close()
+        self.frontier.close()
+        if self.reporter:
+            self.reporter.close()
@@ -0,0 +1,114 @@
+import asyncio
+import multiprocessing
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import aiohttp
+
+from utils import get_logger
+from utils.download import download_async
+from utils.metrics import metrics, start_reporter
+from crawler.frontier import Frontier
+from crawler.report import print_report
+import scraper
+
+
+class AsyncCrawler(object):
+    ''' Crawl engine that runs up to config.concurrency downloads at once
+    on one event loop, over a single pool of keep-alive connections to the
+    cache server. Politeness still comes from the frontier; the scraper and
+    frontier updates run in a thread pool so parsing never blocks the loop.
+    With PARSEPROCESSES set, pages are parsed in a process pool instead.
+    '''
+
+    def __init__(self, config, restart, frontier_factory=Frontier):
+        self.config = config
+        self.logger = get_logger("CRAWLER")
+        self.frontier = frontier_factory(config, restart)
+        self.parse_pool = None
+        self.reporter = None
+
+    def start(self):
+        self.reporter = start_reporter(self.config, self.logger)
+        if self.config.parse_processes:
+            self.parse_pool = ProcessPoolExecutor(
+                max_workers=self.config.parse_processes,
+                mp_context=multiprocessing.get_context("spawn"))
+        asyncio.run(self._crawl())
+        if self.parse_pool:
+            self.parse_pool.shutdown()
+        self.frontier.close()
+        if self.reporter:
+            self.reporter.close()
+        print_report(self.frontier)
+
+    async def _crawl(self):
+        connector = aiohttp.TCPConnector(limit=self.config.concurrency)
+        with ThreadPoolExecutor() as executor:
+            async with aiohttp.ClientSession(connector=connector) as session:
+                in_flight = set()
+                while True:
+                    if len(in_flight) >= self.config.concurrency:
+                        await asyncio.wait(
+                            in_flight, return_when=asyncio.FIRST_COMPLETED)
+                        continue
+                    tbd_url, wait = self.frontier.try_get_tbd_url()
+                    if tbd_url:
+                        task = asyncio.create_task(
+                            self._crawl_url(session, executor, tbd_url))
+                        in_flight.add(task)
+                        task.add_done_callback(in_flight.discard)
+                    elif in_flight:
+                        # Finished downloads may add urls for ready hosts.
+                        await asyncio.wait(
+                            in_flight, timeout=wait,
+                            return_when=asyncio.FIRST_COMPLETED)
+                    elif wait is not None:
+                        await asyncio.sleep(wait)
+                    else:
+                        self.logger.info("Frontier is empty. Stopping Crawler.")
+                        break
+
+    async def _crawl_url(self, session, executor, tbd_url):
+        try:
+            with metrics.timer("download"):
+                resp = await download_async(
+                    tbd_url, self.config, session, self.logger)
+            metrics.count("pages")
+            metrics.count(f"status.{resp.status}")
+            self.logger.info(
+                f"Downloaded {tbd_url}, status <{resp.status}>, "
+                f"using cache {self.config.cache_server}.")
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                executor, self.frontier.save_page, tbd_url, resp)
+            if (self.parse_pool and resp.status == 200
+                    and resp.raw_response is not None):
+                with metrics.timer("analyze"):
+                    page = await loop.run_in_executor(
+                        self.parse_pool, scraper.analyze_page, tbd_url,
+                        resp.raw_response.content,
+                        self.frontier.known_hash(tbd_url))
+                await loop.run_in_executor(
+                    executor, self._merge, tbd_url, page)
+            else:
+                await loop.run_in_executor(
+                    executor, self._scrape, tbd_url, resp)
+        except Exception:
+            # The url stays incomplete in the save file and is retried on
+            # the next resume.
+            self.logger.exception(f"Failed to crawl {tbd_url}.")
+            self.frontier.release_url(tbd_url)
+
+    def _scrape(self, tbd_url, resp):
+        self._complete(
+            tbd_url, scraper.scraper(tbd_url, resp, self.frontier))
+
+    def _merge(self, tbd_url, page):
+        self._complete(
+            tbd_url, scraper.merge_page(tbd_url, page, self.frontier))
+
+    def _complete(self, tbd_url, scraped_urls):
+        for scraped_url in scraped_urls:
+            self.frontier.add_url(scraped_url, tbd_url)
+        self.frontier.mark_url_complete(tbd_url)
@@ -1,24 +1,102 @@
 import os
-import shelve
+import time
+import heapq
+import pickle
 
-from threading import Thread, RLock
+from collections import namedtuple
+from functools import partial
+from threading import Thread, Lock, RLock, Condition
 from queue import Queue, Empty
+from urllib.parse import urlparse
 
 from utils import get_logger, get_urlhash, normalize
+from utils.simhash_index import SimhashIndex
+from utils.content_hashes import ContentHashSet
+from utils.word_stats import WordStats
+from utils.url_seen import UrlSeenSet
+from utils.metrics import metrics
+from utils.page_store import PageStore
+from utils.thread_stats import Tally, Longest
+from crawler.store import FrontierStore, UrlRecord
+from crawler.scoring import get_scorer
+from crawler.robots import RobotsCache
+from crawler.traps import TrapDetector
+from crawler.report import TOP_WORDS
 from scraper import is_valid
 
+# What the frontier remembers about a url being crawled, to score the
+# links found on it and to record it once it is complete. marks are the
+# fingerprint counts when it was handed out, see _before_flush, and
+# counts what its page adds to the analytics, see count_page.
+Parent = namedtuple(
+    "Parent", ["depth", "score", "text_ratio", "content_hash", "marks", "counts"],
+    defaults=(None, None, None, None))
+
+# Bounds for the adaptive recrawl interval, in seconds.
+MIN_RECRAWL_INTERVAL = 3600
+MAX_RECRAWL_INTERVAL = 30 * 86400
+
+# A resumed crawl loads urls from the save file this many at a time.
+RESUME_BATCH = 10000
+
+# How often try_get_tbd_url callers look again while the only urls left
+# wait for their host's robots.txt.
+ROBOTS_POLL = 0.1
+
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
-        self.fingerprints = set()
-        self.sim_fingerprints = set()
-        self.downloaded = set()
-        self.max_words_url = ""
-        self.max_words = 0
-        self.word_counts = {}
-        self.subdomains = {}
+        # self.lock guards the scheduler and the urls in flight, and is only
+        # held for queue operations. The seen set, the save file and the
+        # analytics each have their own locks, so workers that add urls or
+        # merge pages do not wait for the ones getting urls.
+        self.lock = RLock()
+        self.seen_lock = Lock()
+        self.host_ready = Condition(self.lock)
+        # Per-host politeness scheduler. Every host with work has a heap of
+        # (-score, order, url, depth). Hosts inside their politeness delay
+        # wait in host_heap as (ready time, host); hosts past it are in
+        # ready_hosts as (-best score, host), so the best url of any ready
+        # host goes first. Stale ready_hosts entries are skipped when popped.
+        self.host_queues = dict()
+        self.host_heap = list()
+        self.ready_hosts = list()
+        self.ready = set()
+        self.next_allowed = dict()
+        self.host_delays = dict()
+        # Hosts whose robots.txt rules expired, with the scheme to fetch
+        # them again, and hosts being refetched. A refetch takes the host's
+        # next turn and runs in the robots thread, see try_get_tbd_url.
+        self.robots_due = dict()
+        self.robots_refreshing = set()
+        self.robots_refresh = Queue()
+        # Urls of hosts without robots.txt rules yet, as host: {url: (score,
+        # depth)}. The robots thread fetches the rules and adds them.
+        self.robots_held = dict()
+        self.host_urls = dict()
+        self.order = 0
+        self.tbd_count = 0
+        # Urls handed out and not yet complete or released. Crawling them
+        # may add more urls, so the crawl is not over while any are left.
+        self.in_flight = 0
+        # Threads blocked in get_tbd_url.
+        self.waiting = 0
+        self.parents = dict()
+        # Content hash and recrawl interval of completed urls being
+        # crawled again, see --recrawl.
+        self.previous = dict()
+        # Save file batches still to load on resume, as [read, cursor].
+        self.resume = list()
+        self.scorer = get_scorer(config.scorer)
+        self.longest = Longest()
+        self.subdomains = Tally()
+        # Pages whose counts were applied to the analytics, and how many
+        # of them the checkpoint has. The analytics as a flush took its
+        # writes, written once it commits, see _snapshot_analytics.
+        self.counted = 0
+        self.checkpointed = 0
+        self.snapshot = None
         
         if not os.path.exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
@@ -30,8 +108,59 @@ class Frontier(object):
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
             os.remove(self.config.save_file)
+        if not os.path.exists(self.config.save_file):
+            # Side files are only meaningful with the save file they came from.
+            for path in self.side_files:
+                if os.path.exists(path):
+                    os.remove(path)
+        # Fingerprints for exact and near duplicates, and the other
+        # analytics, are kept next to the save file too.
+        self.fingerprints = ContentHashSet(self.hashes_file)
+        self.sim_fingerprints = SimhashIndex(self.simhash_file)
+        # What the pages of each url template yield, to stop crawler traps.
+        self.traps = TrapDetector(
+            self.config.trap_min_pages, self.config.trap_throttle,
+            self.config.trap_ban)
+        # Word counts track at least the TOP_WORDS words the report prints.
+        self.word_counts = WordStats(
+            self.config.word_budget, max(self.config.top_words, TOP_WORDS))
+        # The analytics are checkpointed next to the save file with every
+        # flush, so a resumed crawl has the counts of exactly the pages the
+        # save file has as complete.
+        if os.path.exists(self.analytics_file):
+            self._load_analytics()
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+        self.save = FrontierStore(
+            self.config.save_file, self.config.flush_size,
+            self.config.flush_interval, self.logger)
+        self.save.before_flush = self._before_flush
+        self.save.on_swap = self._snapshot_analytics
+        # Every url hash ever added, checked before the save file. It is
+        # derived from the save file, so rebuild it when it may disagree.
+        self.seen = UrlSeenSet(self.seen_file)
+        if self.seen.dirty or len(self.seen) != len(self.save):
+            self.logger.info(
+                f"Rebuilding {self.seen_file} from {self.config.save_file}.")
+            self.seen.rebuild(self.save.keys())
+        # robots.txt rules outlive the crawl progress; they expire by TTL.
+        self.robots = RobotsCache(
+            self.config, f"{self.config.save_file}.robots",
+            self.config.robots_ttl, self.logger)
+        Thread(target=self._refresh_robots, daemon=True).start()
+        # Downloaded html for reprocess.py. Like robots.txt rules, it is
+        # kept when the crawl restarts.
+        self.pages = None
+        if self.config.page_store:
+            self.pages = PageStore(
+                self.config.page_store, self.config.page_compression,
+                self.config.segment_size)
+        metrics.gauge("frontier.depth", lambda: self.tbd_count)
+        metrics.gauge("frontier.hosts", lambda: len(self.host_queues))
+        metrics.gauge("frontier.in_flight", lambda: self.in_flight)
+        metrics.gauge("frontier.largest_hosts", self._largest_hosts)
+        metrics.gauge("frontier.seen", lambda: len(self.seen))
+        metrics.gauge("frontier.traps", self.traps.worst)
+        metrics.gauge("store.pending", lambda: len(self.save.pending))
         if restart:
             for url in self.config.seed_urls:
                 self.add_url(url)
@@ -42,39 +171,502 @@ class Frontier(object):
                 for url in self.config.seed_urls:
                     self.add_url(url)
 
+    @property
+    def simhash_file(self):
+        return f"{self.config.save_file}.simhash"
+
+    @property
+    def hashes_file(self):
+        return f"{self.config.save_file}.hashes"
+
+    @property
+    def analytics_file(self):
+        return f"{self.config.save_file}.analytics"
+
+    @property
+    def traps_file(self):
+        return f"{self.config.save_file}.traps"
+
+    @property
+    def seen_file(self):
+        return f"{self.config.save_file}.seen"
+
+    @property
+    def words_file(self):
+        return f"{self.config.save_file}.words"
+
+    @property
+    def side_files(self):
+        ''' Files that belong to the save file and go away with it. '''
+        save_file = self.config.save_file
+        return [
+            f"{save_file}-wal", f"{save_file}-shm", self.simhash_file,
+            self.hashes_file, self.words_file, self.analytics_file,
+            self.traps_file, self.seen_file]
+
+    def _largest_hosts(self, count=10):
+        ''' Queue sizes of the hosts with the most urls waiting. '''
+        sizes = [(len(queue), host) for host, queue in list(self.host_queues.items())]
+        return {host: size for size, host in heapq.nlargest(count, sizes)}
+
     def _parse_save_file(self):
-        ''' This function can be overridden for alternate saving techniques. '''
+        ''' This function can be overridden for alternate saving techniques.
+
+        Does not read the whole save file: urls are loaded RESUME_BATCH at
+        a time, best first, whenever the frontier runs low (see _resume).
+        Only rows that existed at startup are read; urls added since are
+        scheduled as they are added. '''
         total_count = len(self.save)
-        tbd_count = 0
-        for url, completed in self.save.values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
-                tbd_count += 1
+        last = self.save.last_rowid()
+        self.resume = [[partial(self.save.incomplete, last=last), None]]
         self.logger.info(
-            f"Found {tbd_count} urls to be downloaded from {total_count} "
-            f"total urls discovered.")
+            f"Found {self.save.count_incomplete()} urls to be downloaded from "
+            f"{total_count} total urls discovered.")
+        if self.config.recrawl:
+            now = time.time()
+            self.resume.append([partial(self.save.due, now, last=last), None])
+            self.logger.info(
+                f"Found {self.save.count_due(now)} completed urls due for a recrawl.")
+        self._resume()
 
-    def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+    def _resume(self):
+        ''' Schedule save file urls until RESUME_BATCH are queued. '''
+        with self.lock:
+            while self.resume and self.tbd_count < RESUME_BATCH:
+                with metrics.timer("resume"):
+                    read, cursor = self.resume[0]
+                    batch = read(cursor, limit=RESUME_BATCH)
+                if not batch:
+                    self.resume.pop(0)
+                    continue
+                self.resume[0][1] = batch[-1][0]
+                for _, record in batch:
+                    if not is_valid(record.url):
+                        continue
+                    if record.completed:
+                        self.previous[record.url] = (record.content_hash, record.interval)
+                    self._schedule(record.url, record.score, record.depth)
+
+    def _schedule(self, url, score=0.0, depth=0):
+        host = urlparse(url).netloc.lower()
+        with self.lock:
+            entry = (-score, self.order, url, depth)
+            self.order += 1
+            self.host_urls[host] = self.host_urls.get(host, 0) + 1
+            self.tbd_count += 1
+            queue = self.host_queues.get(host)
+            if queue is None:
+                self.host_queues[host] = [entry]
+                heapq.heappush(
+                    self.host_heap, (self.next_allowed.get(host, 0), host))
+                self.host_ready.notify()
+                return
+            heapq.heappush(queue, entry)
+            if host in self.ready and queue[0] is entry:
+                # A ready host's best url improved.
+                heapq.heappush(self.ready_hosts, (entry[0], host))
+
+    def get_tbd_url(self, stop=None):
+        ''' Block until some host is past its politeness deadline and hand
+        out one of its urls. Returns None once nothing is left to crawl,
+        or when the optional `stop` Event is set (see wake). '''
+        with self.lock:
+            self.waiting += 1
+            try:
+                while not (stop and stop.is_set()):
+                    url, wait = self.try_get_tbd_url()
+                    if url or self.finished():
+                        return url
+                    self.host_ready.wait(wait)
+                return None
+            finally:
+                self.waiting -= 1
+
+    def finished(self):
+        ''' True once nothing is queued and no url is being crawled. '''
+        with self.lock:
+            return (not self.tbd_count and not self.in_flight
+                    and not self.resume and not self.robots_held)
+
+    def wake(self):
+        ''' Wake every thread blocked in get_tbd_url to check again. '''
+        with self.lock:
+            self.host_ready.notify_all()
+
+    def ready_host_count(self):
+        ''' Hosts with queued urls that are past their politeness delay. '''
+        with self.lock:
+            now = time.monotonic()
+            return len(self.ready) + sum(
+                1 for ready_time, host in self.host_heap
+                if self.next_allowed.get(host, 0) <= ready_time <= now)
+
+    def try_get_tbd_url(self):
+        ''' Non-blocking get_tbd_url. Returns (url, None) when a host is
+        ready, (None, seconds until the next host is ready) while every
+        host is cooling down or urls wait for robots.txt, and (None, None)
+        when nothing is queued. '''
+        with self.lock:
+            if self.resume and self.tbd_count < RESUME_BATCH // 2:
+                self._resume()
+            now = time.monotonic()
+            while self.host_heap and self.host_heap[0][0] <= now:
+                ready_time, host = heapq.heappop(self.host_heap)
+                if (ready_time < self.next_allowed.get(host, 0)
+                        or host in self.ready or host not in self.host_queues):
+                    # Superseded by a later entry, see _defer.
+                    continue
+                self.ready.add(host)
+                heapq.heappush(
+                    self.ready_hosts, (self.host_queues[host][0][0], host))
+            while True:
+                while self.ready_hosts:
+                    priority, host = heapq.heappop(self.ready_hosts)
+                    if host in self.ready and self.host_queues[host][0][0] == priority:
+                        break
+                else:
+                    if self.host_heap:
+                        return None, self.host_heap[0][0] - now
+                    if self.robots_held:
+                        return None, ROBOTS_POLL
+                    return None, None
+                scheme = self.robots_due.pop(host, None)
+                if scheme:
+                    # The robots.txt refetch is the host's request for this
+                    # turn; its next url waits a politeness delay after it.
+                    self.robots_refreshing.add(host)
+                    self.robots_refresh.put((scheme, host))
+                    self.ready.discard(host)
+                    self._defer(host, now + self.host_delays.get(
+                        host, self.config.time_delay))
+                    continue
+                queue = self.host_queues[host]
+                priority, _, url, depth = heapq.heappop(queue)
+                self.tbd_count -= 1
+                if not self.traps.banned(url):
+                    break
+                # Queued before its template was banned. Skipping it costs
+                # no request, so the host stays ready. It stays incomplete
+                # in the save file.
+                metrics.count("traps.skipped")
+                if queue:
+                    heapq.heappush(self.ready_hosts, (queue[0][0], host))
+                else:
+                    self.ready.discard(host)
+                    del self.host_queues[host]
+                if self.finished():
+                    self.host_ready.notify_all()
+            self.ready.discard(host)
+            self.in_flight += 1
+            self.parents[url] = Parent(
+                depth, -priority,
+                marks=(len(self.fingerprints), len(self.sim_fingerprints)))
+            self.next_allowed[host] = now + self.host_delays.get(
+                host, self.config.time_delay)
+            if queue:
+                heapq.heappush(
+                    self.host_heap, (self.next_allowed[host], host))
+            else:
+                del self.host_queues[host]
+            return url, None
+
+    def add_url(self, url, parent=None):
+        ''' Add a url found on the page `parent`, or a seed url. '''
+        with metrics.timer("add_url"):
+            url = normalize(url)
+            score, depth = self.score(url, parent)
+            self._add(url, score, depth)
 
-    def add_url(self, url):
-        url = normalize(url)
+    def score(self, url, parent=None):
+        ''' (score, depth) of a url found on the page `parent`. '''
+        with self.lock:
+            info = self.parents.get(parent) if parent else None
+            host_urls = self.host_urls.get(urlparse(url).netloc.lower(), 0)
+        if info is None:
+            return self.scorer(url, 0, None, host_urls), 0
+        depth = info.depth + 1
+        return self.scorer(url, depth, info.text_ratio, host_urls), depth
+
+    def _add(self, url, score, depth):
         urlhash = get_urlhash(url)
-        self.downloaded.add(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            self.to_be_downloaded.append(url)
-    
+        with self.seen_lock:
+            if urlhash in self.seen:
+                return
+        if not self.traps.admit(url):
+            metrics.count("traps.rejected")
+            return
+        allowed = self.robots_allow(url)
+        if allowed is None:
+            self._hold(url, score, depth)
+            return
+        if not allowed:
+            metrics.count("robots.disallowed")
+            return
+        with self.seen_lock:
+            if not self.seen.add(urlhash):
+                return
+        # Only the thread that added the url to seen gets here.
+        self.save[urlhash] = UrlRecord(url, False, score, depth)
+        self._schedule(url, score, depth)
+
+    def robots_allow(self, url):
+        ''' Check url against its host's robots.txt rules, or return None
+        if the host has none yet. Expired rules are still used until the
+        host's next turn fetches them again. '''
+        parsed = urlparse(url)
+        host = parsed.netloc.lower()
+        rules = self.robots.cached(host)
+        if rules is None:
+            return None
+        if host not in self.host_delays:
+            self._set_delay(host, rules, False)
+        elif self.robots.expired(host):
+            with self.lock:
+                if host not in self.robots_refreshing:
+                    self.robots_due.setdefault(host, parsed.scheme)
+        return self.robots.allowed(rules, url)
+
+    def _hold(self, url, score, depth):
+        ''' Keep a url of a host without robots.txt rules until the robots
+        thread has fetched them, so the thread that found it never waits
+        for the cache server. A host with queued urls fetches them in its
+        next turn, like expired rules. '''
+        parsed = urlparse(url)
+        host = parsed.netloc.lower()
+        with self.lock:
+            if host in self.robots.rules:
+                # Fetched since robots_allow looked.
+                held = None
+            else:
+                held = self.robots_held.get(host)
+                if held is None:
+                    held = self.robots_held[host] = dict()
+                    if host in self.host_queues:
+                        self.robots_due.setdefault(host, parsed.scheme)
+                    else:
+                        self.robots_refreshing.add(host)
+                        self.robots_refresh.put((parsed.scheme, host))
+                held[url] = (score, depth)
+        if held is None:
+            self._add(url, score, depth)
+
+    def _set_delay(self, host, rules, fetched):
+        delay = max(self.robots.crawl_delay(rules) or 0, self.config.time_delay)
+        with self.lock:
+            self.host_delays[host] = delay
+            if fetched:
+                self._defer(host, time.monotonic() + delay)
+
+    def _defer(self, host, ready_time):
+        ''' Hand out no url of host before ready_time. host_heap entries
+        that are earlier than next_allowed are skipped when popped. '''
+        with self.lock:
+            if ready_time <= self.next_allowed.get(host, 0):
+                return
+            self.next_allowed[host] = ready_time
+            if host in self.host_queues:
+                self.ready.discard(host)
+                heapq.heappush(self.host_heap, (ready_time, host))
+
+    def _refresh_robots(self):
+        ''' Fetch the robots.txt rules _hold and try_get_tbd_url schedule,
+        off the threads that add urls, then add the urls held for them.
+        The fetch counts as a request to the host, and a Crawl-delay longer
+        than POLITENESS becomes the host's delay. '''
+        while True:
+            scheme, host = self.robots_refresh.get()
+            try:
+                rules = self.robots.refresh(scheme, host)
+                self._set_delay(host, rules, True)
+            except Exception:
+                self.logger.exception(f"Could not refresh robots.txt of {host}.")
+            with self.lock:
+                self.robots_refreshing.discard(host)
+                held = self.robots_held.pop(host, None)
+            if held and host in self.robots.rules:
+                for url, (score, depth) in held.items():
+                    self._add(url, score, depth)
+            elif held:
+                self.logger.error(
+                    f"Dropped {len(held)} urls of {host} without robots.txt rules.")
+            with self.lock:
+                if self.finished():
+                    self.host_ready.notify_all()
+
+    def set_text_ratio(self, url, text_ratio):
+        ''' Record the text ratio of a crawled page for scoring its links. '''
+        with self.lock:
+            info = self.parents.get(url)
+            if info:
+                self.parents[url] = info._replace(text_ratio=text_ratio)
+
+    def set_content_hash(self, url, content_hash):
+        ''' Record the content hash of a crawled page. '''
+        with self.lock:
+            info = self.parents.get(url)
+            if info:
+                self.parents[url] = info._replace(content_hash=content_hash)
+
+    def count_page(self, url, counts):
+        ''' Record what a crawled page adds to the analytics, a
+        scraper.PageCounts. It is applied when the url is marked complete,
+        in the same flush of the save file. '''
+        with self.lock:
+            info = self.parents.get(url)
+            if info:
+                self.parents[url] = info._replace(counts=counts)
+                return
+        # Not handed out by this frontier, so there is nothing to wait for.
+        self._apply_counts(url, counts)
+
+    def _apply_counts(self, url, counts):
+        if counts.subdomain:
+            self.subdomains.add(counts.subdomain)
+        if counts.outcome:
+            self.traps.record(url, counts.outcome)
+        if counts.word_count:
+            self.longest.offer(url, counts.word_count)
+        if counts.word_freq:
+            self.word_counts.update(counts.word_freq)
+        self.counted += 1
+
+    def known_hash(self, url):
+        ''' Content hash from the last crawl of a url being recrawled. '''
+        with self.lock:
+            previous = self.previous.get(url)
+        return previous[0] if previous else None
+
+    def _recrawl_interval(self, previous, content_hash):
+        ''' Halve the time until the next recrawl for a page that changed
+        and double it for one that did not. '''
+        if previous is None or previous[1] is None:
+            return self.config.recrawl_interval
+        previous_hash, interval = previous
+        if content_hash is None:
+            return interval
+        if content_hash != previous_hash:
+            return max(interval / 2, MIN_RECRAWL_INTERVAL)
+        return min(max(interval * 2, MIN_RECRAWL_INTERVAL), MAX_RECRAWL_INTERVAL)
+
     def mark_url_complete(self, url):
         urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
+        with metrics.timer("mark_url_complete"):
+            with self.seen_lock:
+                seen = urlhash in self.seen
+            if not seen:
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+
+            with self.lock:
+                info = self.parents.get(url) or Parent(0, 0.0)
+                previous = self.previous.get(url)
+            # Keep the last known hash when this fetch had no content.
+            content_hash = info.content_hash or (previous[0] if previous else None)
+            # Recorded before the url stops being in flight, so a flush
+            # never writes its fingerprints without it (see _before_flush),
+            # and together with its counts, so every checkpoint of the
+            # analytics matches the save file (see _snapshot_analytics).
+            self.save.put(
+                urlhash, UrlRecord(
+                    url, True, info.score, info.depth, content_hash, time.time(),
+                    self._recrawl_interval(previous, info.content_hash)),
+                partial(self._apply_counts, url, info.counts) if info.counts else None)
+            with self.lock:
+                if self.parents.pop(url, None):
+                    self._landed()
+                self.previous.pop(url, None)
+
+    def _snapshot_analytics(self):
+        ''' Runs when a flush takes the pending writes, with them locked.
+        Copies the analytics, which then hold the counts of every page
+        complete in those writes and of no other page not yet complete in
+        the save file, unless nothing was counted since the checkpoint. '''
+        if self.counted == self.checkpointed:
+            return
+        max_words, max_words_url = self.longest.value()
+        self.snapshot = self.counted, (
+            self.subdomains.counts(), max_words, max_words_url,
+            self.word_counts.state(), self.traps.state())
+
+    def _write_analytics(self, state):
+        with open(f"{self.analytics_file}.tmp", "wb") as analytics:
+            pickle.dump(state, analytics, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{self.analytics_file}.tmp", self.analytics_file)
+
+    def _load_analytics(self):
+        with open(self.analytics_file, "rb") as analytics:
+            state = pickle.load(analytics)
+        subdomains, max_words, max_words_url = state[:3]
+        self.subdomains = Tally(subdomains)
+        self.longest = Longest(max_words, max_words_url)
+        if len(state) > 3:
+            self.word_counts.restore(state[3])
+            self.traps.restore(state[4])
+            return
+        # Older checkpoints kept the word counts and trap stats apart.
+        if os.path.exists(self.words_file):
+            with open(self.words_file, "rb") as words:
+                self.word_counts.restore(pickle.load(words))
+        if os.path.exists(self.traps_file):
+            with open(self.traps_file, "rb") as traps:
+                self.traps.restore(traps.read())
+
+    def _before_flush(self):
+        ''' Runs before each save file flush. Takes the fingerprints added
+        before the oldest url still being crawled was handed out, which
+        all belong to completed pages, and returns a function that writes
+        them after the flush, or puts them back if it failed. The
+        fingerprint logs then never hold a page the save file does not
+        have as complete, so after a crash a page crawled again is not
+        taken for a duplicate of itself. The function also writes the
+        analytics the flush took, see _snapshot_analytics. '''
+        with self.lock:
+            marks = [info.marks for info in self.parents.values() if info.marks]
+            hashes = self.fingerprints.take(min(
+                (mark[0] for mark in marks), default=len(self.fingerprints)))
+            simhashes = self.sim_fingerprints.take(min(
+                (mark[1] for mark in marks), default=len(self.sim_fingerprints)))
+
+        def write(committed):
+            snapshot, self.snapshot = self.snapshot, None
+            if committed:
+                self.fingerprints.write(hashes)
+                self.sim_fingerprints.write(simhashes)
+                if snapshot:
+                    self._write_analytics(snapshot[1])
+                    self.checkpointed = snapshot[0]
+            else:
+                self.fingerprints.untake(hashes)
+                self.sim_fingerprints.untake(simhashes)
+        return write
+
+    def save_page(self, url, resp):
+        ''' Keep the html of a downloaded page if PAGESTORE is set. '''
+        if self.pages is not None and resp.status == 200 and resp.raw_response is not None:
+            with metrics.timer("page_store"):
+                self.pages.put(url, resp.raw_response.content)
+
+    def release_url(self, url):
+        ''' Give up on a url that could not be crawled. It stays incomplete
+        in the save file and is crawled again on resume. '''
+        with self.lock:
+            if self.parents.pop(url, None):
+                self.previous.pop(url, None)
+                self._landed()
+
+    def _landed(self):
+        self.in_flight -= 1
+        if self.finished():
+            # Threads waiting for urls this one might have added are done.
+            self.host_ready.notify_all()
 
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+    def close(self):
+        ''' Flush pending frontier writes to the save file. '''
+        self.save.close()
+        self.seen.close()
+        self.robots.close()
+        if self.pages is not None:
+            self.pages.close()
+        self.fingerprints.close()
+        self.sim_fingerprints.close()
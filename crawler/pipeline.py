@@ -0,0 +1,119 @@
+import multiprocessing
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Thread, Semaphore, Condition, Lock
+from queue import Queue
+
+from utils import get_logger
+from utils.metrics import metrics
+import scraper
+
+
+class ParsePipeline(object):
+    ''' Parse downloaded pages in a process pool.
+
+    Workers hand over (url, resp) with submit(). The page is parsed by
+    scraper.analyze_page in another process, so parsing scales with cores
+    instead of contending for the GIL, and the compact Page it returns is
+    merged into the frontier by a single merger thread. At most
+    config.parse_queue_size pages are waiting to be parsed or merged;
+    submit() blocks until there is room again.
+
+    If a parse process dies, e.g. killed for using too much memory, the
+    pool is broken: the pages it was parsing are released and a new pool
+    takes the next ones.
+    '''
+
+    def __init__(self, config, frontier):
+        self.logger = get_logger("PIPELINE")
+        self.config = config
+        self.frontier = frontier
+        self.pool_lock = Lock()
+        self.pool = self._new_pool()
+        self.slots = Semaphore(config.parse_queue_size)
+        self.results = Queue()
+        self.outstanding = 0
+        self.idle = Condition()
+        self.merger = Thread(target=self._merge_loop, daemon=True)
+        self.merger.start()
+        metrics.gauge("pipeline.outstanding", lambda: self.outstanding)
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.config.parse_processes,
+            mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, url, resp):
+        self.slots.acquire()
+        with self.idle:
+            self.outstanding += 1
+        if resp.status != 200 or resp.raw_response is None:
+            self.results.put((url, None))
+            return
+        start = time.perf_counter()
+        args = (url, resp.raw_response.content, self.frontier.known_hash(url))
+        try:
+            future = self._submit(args)
+        except Exception:
+            # Nothing will be merged for this page, so give its slot back.
+            self._done()
+            raise
+        future.add_done_callback(lambda future: self._parsed(url, future, start))
+
+    def _submit(self, args):
+        pool = self.pool
+        try:
+            return pool.submit(scraper.analyze_page, *args)
+        except BrokenProcessPool:
+            with self.pool_lock:
+                if self.pool is pool:
+                    self.logger.error("A parse process died, starting a new pool.")
+                    metrics.count("pipeline.restarts")
+                    self.pool = self._new_pool()
+                    pool.shutdown(wait=False)
+            return self.pool.submit(scraper.analyze_page, *args)
+
+    def _parsed(self, url, future, start):
+        # Includes the time spent waiting for a free process.
+        metrics.observe("analyze", time.perf_counter() - start)
+        self.results.put((url, future))
+
+    def _merge_loop(self):
+        while True:
+            url, future = self.results.get()
+            if url is None:
+                break
+            try:
+                with metrics.timer("merge"):
+                    scraped_urls = (
+                        scraper.merge_page(url, future.result(), self.frontier)
+                        if future else list())
+                    for scraped_url in scraped_urls:
+                        self.frontier.add_url(scraped_url, url)
+                    self.frontier.mark_url_complete(url)
+            except Exception:
+                # The url stays incomplete and is retried on resume.
+                self.logger.exception(f"Failed to parse {url}.")
+                self.frontier.release_url(url)
+            finally:
+                self._done()
+
+    def _done(self):
+        self.slots.release()
+        with self.idle:
+            self.outstanding -= 1
+            self.idle.notify_all()
+
+    def join(self):
+        ''' Wait until every submitted page has been merged. '''
+        with self.idle:
+            while self.outstanding:
+                self.idle.wait()
+
+    def close(self):
+        self.join()
+        self.results.put((None, None))
+        self.merger.join()
+        self.pool.shutdown()
@@ -0,0 +1,68 @@
+import heapq
+
+from collections import Counter
+
+TOP_WORDS = 50
+
+
+def summarize(frontier, all_words=False):
+    ''' The analytics of one frontier as plain data. With all_words, every
+    tracked word count is included so summaries can be merged exactly. '''
+    max_words, max_words_url = frontier.longest.value()
+    words = (
+        frontier.word_counts.items() if all_words
+        else frontier.word_counts.most_common(TOP_WORDS))
+    return {
+        "unique_pages": len(frontier.seen),
+        "max_words_url": max_words_url,
+        "max_words": max_words,
+        "words": words,
+        "subdomains": frontier.subdomains.counts()}
+
+
+def merge_summaries(summaries):
+    ''' Combine the summaries of frontiers that crawled disjoint hosts. '''
+    word_counts = Counter()
+    subdomains = Counter()
+    longest = max(summaries, key=lambda summary: summary["max_words"])
+    for summary in summaries:
+        word_counts.update(dict(summary["words"]))
+        subdomains.update(summary["subdomains"])
+    return {
+        "unique_pages": sum(summary["unique_pages"] for summary in summaries),
+        "max_words_url": longest["max_words_url"],
+        "max_words": longest["max_words"],
+        "words": heapq.nsmallest(
+            TOP_WORDS, word_counts.items(), key=lambda x: (-x[1], x[0])),
+        "subdomains": dict(subdomains)}
+
+
+def print_report(frontier):
+    ''' Print the crawl analytics gathered by the scraper. '''
+    print_summary(summarize(frontier))
+
+
+def print_summary(summary):
+    #Print unique pages found
+    print(f'Unique pages found: {summary["unique_pages"]}')
+
+    print()
+    #Print longest page
+    print(f'Longest page: {summary["max_words_url"]} with {summary["max_words"]} words')
+
+    print()
+
+    #Print most common words
+    items = [item[0] for item in summary["words"][:TOP_WORDS]]
+    print(f'50 most common words across pages:{items}')
+
+    print()
+    #Print subdomains of ics.uci.edu
+    print('Subdomains of ics.uci.edu:')
+    subdomains = dict(summary["subdomains"])
+    subdomains.pop("https://ics.uci.edu", None)
+    subdomains.pop("https://www.ics.uci.edu", None)
+    subdomain_items = subdomains.items()
+    subdomain_items = sorted(subdomain_items)
+    for key, item in subdomain_items:
+        print(f'{key}, {item}')
@@ -0,0 +1,130 @@
+import sqlite3
+import time
+
+from threading import Lock
+from urllib.robotparser import RobotFileParser
+
+from utils.download import download
+from utils.metrics import metrics
+
+# Retry hosts whose robots.txt could not be fetched sooner than the TTL.
+ERROR_TTL = 600
+# Ignore crawl delays longer than this.
+MAX_CRAWL_DELAY = 60
+
+
+class RobotsCache(object):
+    ''' robots.txt rules per host, fetched through the cache server.
+
+    Rules are parsed with urllib.robotparser and kept in memory and in a
+    small SQLite file, so a restarted crawl does not fetch them again
+    until `ttl` seconds after they were fetched. Status codes are handled
+    like RobotFileParser.read: 401 and 403 disallow everything, other 4xx
+    allow everything. Cache server errors and 5xx also allow everything,
+    but are retried after ERROR_TTL.
+
+    cached() never fetches: it returns None for a host without rules,
+    and expired rules until refresh() is called. The frontier schedules
+    refresh() like a request to the host, off the threads that add urls.
+    '''
+
+    def __init__(self, config, path, ttl=86400, logger=None):
+        self.config = config
+        self.ttl = ttl
+        self.logger = logger
+        self.lock = Lock()
+        self.rules = dict()
+        self.fetching = dict()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS robots (host TEXT PRIMARY KEY, "
+            "status INTEGER NOT NULL, body TEXT NOT NULL, "
+            "expires REAL NOT NULL)")
+        self.conn.commit()
+
+    def _parser(self, status, body):
+        parser = RobotFileParser()
+        if status in (401, 403):
+            parser.disallow_all = True
+        elif status == 200:
+            parser.parse(body.splitlines())
+        else:
+            parser.allow_all = True
+        return parser
+
+    def _load(self, host):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, body, expires FROM robots WHERE host = ?",
+                (host,)).fetchone()
+        if row is None or row[2] < time.time():
+            return None
+        return row[2], self._parser(row[0], row[1])
+
+    def _fetch(self, scheme, host):
+        url = f"{scheme}://{host}/robots.txt"
+        body = ""
+        try:
+            with metrics.timer("robots.fetch"):
+                resp = download(url, self.config, self.logger)
+            status = resp.status
+            if status == 200 and resp.raw_response is not None:
+                body = resp.raw_response.content.decode("utf-8", errors="replace")
+        except Exception as e:
+            # Treated like a cache server error: allowed, retried soon.
+            if self.logger:
+                self.logger.error(f"Could not fetch {url}: {e}")
+            status = 600
+        ttl = self.ttl if status < 500 else ERROR_TTL
+        expires = time.time() + ttl
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO robots (host, status, body, expires) "
+                    "VALUES (?, ?, ?, ?)", (host, status, body, expires))
+        if self.logger:
+            self.logger.info(f"Fetched {url}, status <{status}>.")
+        return expires, self._parser(status, body)
+
+    def _host_lock(self, host):
+        with self.lock:
+            return self.fetching.setdefault(host, Lock())
+
+    def cached(self, host):
+        ''' The rules for host from memory or the SQLite file, or None if
+        it has none that have not expired. '''
+        entry = self.rules.get(host)
+        if entry:
+            return entry[1]
+        with self._host_lock(host):
+            entry = self.rules.get(host)
+            if entry is None:
+                entry = self._load(host)
+                if entry is None:
+                    return None
+                self.rules[host] = entry
+        return entry[1]
+
+    def expired(self, host):
+        ''' Whether the rules get() returns for host are past their TTL. '''
+        entry = self.rules.get(host)
+        return entry is not None and entry[0] < time.time()
+
+    def refresh(self, scheme, host):
+        ''' Fetch the rules of a host again and return them. '''
+        with self._host_lock(host):
+            entry = self.rules[host] = self._fetch(scheme, host)
+        return entry[1]
+
+    def allowed(self, parser, url):
+        return parser.can_fetch(self.config.user_agent, url)
+
+    def crawl_delay(self, parser):
+        delay = parser.crawl_delay(self.config.user_agent)
+        if delay is None:
+            return None
+        return min(float(delay), MAX_CRAWL_DELAY)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,67 @@
+''' Url scoring functions for the frontier.
+
+A scorer is called as scorer(url, depth, text_ratio, host_urls) and
+returns a number; urls with higher scores are crawled first, both within
+a host and when choosing between hosts that are past their politeness
+delay. `depth` is the number of links from a seed url, `text_ratio` is
+the text to html ratio of the page the url was found on (None for seeds)
+and `host_urls` is how many urls of the url's host were discovered so far.
+
+Set SCORER in config.ini to one of the names in SCORERS, or to
+"module:function" for a scorer defined elsewhere.
+'''
+import math
+import re
+
+from importlib import import_module
+
+# Paths that usually lead into calendars, archives and revision histories
+# rather than new content.
+TRAP_PATTERNS = re.compile(
+    r"/(calendar|events?|ical|archives?|tags?|page|revisions?|diff|history"
+    r"|login|feed|rss|share|print|attachment)(/|$)"
+    r"|/\d{4}[/-]\d{1,2}([/-]\d{1,2})?(/|$)"
+    r"|/\d{1,2}[/-]\d{1,2}[/-]\d{4}(/|$)",
+    re.IGNORECASE)
+
+
+def fifo_score(url, depth, text_ratio, host_urls):
+    ''' All urls are equal; each host's urls are crawled in the order they
+    were found. '''
+    return 0.0
+
+
+def depth_score(url, depth, text_ratio, host_urls):
+    ''' Breadth first: shallower urls first. '''
+    return -float(depth)
+
+
+def pattern_penalty(url):
+    return 4.0 * len(TRAP_PATTERNS.findall(url))
+
+
+def default_score(url, depth, text_ratio, host_urls):
+    ''' Breadth first, with penalties for trap-like paths and for hosts
+    that already produced many urls, and a bonus for links found on pages
+    that are mostly text. '''
+    score = -float(depth) - pattern_penalty(url) - 0.5 * math.log1p(host_urls)
+    if text_ratio is not None:
+        score += min(text_ratio, 0.5) * 4
+    return score
+
+
+SCORERS = {
+    "default": default_score,
+    "depth": depth_score,
+    "fifo": fifo_score}
+
+
+def get_scorer(name):
+    if name in SCORERS:
+        return SCORERS[name]
+    module, _, function = name.partition(":")
+    if not function:
+        raise ValueError(
+            f"Unknown scorer {name}, use one of {sorted(SCORERS)} "
+            f"or module:function.")
+    return getattr(import_module(module), function)
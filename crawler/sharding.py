@@ -0,0 +1,225 @@
+import copy
+import multiprocessing
+import os
+
+from bisect import bisect
+from functools import partial
+from hashlib import sha256
+from queue import Empty
+from threading import Thread, Lock
+from urllib.parse import urlparse
+
+from utils import get_logger, normalize
+from crawler import Crawler
+from crawler.frontier import Frontier
+from crawler.report import summarize, merge_summaries, print_summary
+
+# Urls for another shard are sent in batches of this size, or every
+# STATUS_INTERVAL seconds, whichever comes first.
+FORWARD_BATCH = 100
+STATUS_INTERVAL = 0.2
+
+
+class HashRing(object):
+    ''' Consistent hash of hosts onto shards. Every shard owns `replicas`
+    points on the ring and a host belongs to the next point after its
+    hash, so changing the shard count only moves about 1/N of the hosts. '''
+
+    def __init__(self, shard_count, replicas=100):
+        points = sorted(
+            (self._hash(f"{shard}-{replica}"), shard)
+            for shard in range(shard_count) for replica in range(replicas))
+        self.keys = [key for key, _ in points]
+        self.shards = [shard for _, shard in points]
+        self.cache = dict()
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(sha256(value.encode()).digest()[:8], "big")
+
+    def shard_of(self, host):
+        shard = self.cache.get(host)
+        if shard is None:
+            index = bisect(self.keys, self._hash(host)) % len(self.keys)
+            shard = self.cache[host] = self.shards[index]
+        return shard
+
+
+class ShardFrontier(Frontier):
+    ''' Frontier for the hosts one shard owns.
+
+    add_url keeps urls of its own hosts and batches the rest for their
+    owners' inboxes; a receiver thread adds the urls other shards send.
+    Running out of urls does not end the crawl, since another shard may
+    still send some: the frontier is only finished once the coordinator
+    sets `stop`.
+    '''
+
+    def __init__(self, config, restart, shard_id, ring, inboxes, stop):
+        self.shard_id = shard_id
+        self.ring = ring
+        self.inboxes = inboxes
+        self.stop = stop
+        self.outboxes = {shard: list() for shard in range(len(inboxes))}
+        self.outbox_lock = Lock()
+        self.sent = 0
+        self.received = 0
+        super().__init__(config, restart)
+        self.receiver = Thread(target=self._receive_loop, daemon=True)
+        self.receiver.start()
+
+    def owner(self, url):
+        return self.ring.shard_of(urlparse(url).netloc.lower())
+
+    def add_url(self, url, parent=None):
+        shard = self.owner(url)
+        if shard == self.shard_id:
+            super().add_url(url, parent)
+            return
+        # Scored here, where the parent page is known.
+        url = normalize(url)
+        score, depth = self.score(url, parent)
+        with self.outbox_lock:
+            outbox = self.outboxes[shard]
+            outbox.append((url, score, depth))
+            if len(outbox) >= FORWARD_BATCH:
+                self._send(shard)
+
+    def _send(self, shard):
+        batch = self.outboxes[shard]
+        self.outboxes[shard] = list()
+        self.inboxes[shard].put(batch)
+        self.sent += len(batch)
+
+    def flush_outboxes(self):
+        with self.outbox_lock:
+            for shard, outbox in self.outboxes.items():
+                if outbox:
+                    self._send(shard)
+
+    def _receive_loop(self):
+        inbox = self.inboxes[self.shard_id]
+        while True:
+            batch = inbox.get()
+            for url, score, depth in batch:
+                self._add(url, score, depth)
+            with self.lock:
+                self.received += len(batch)
+
+    def finished(self):
+        return self.stop.is_set()
+
+    def status(self):
+        ''' (idle, urls sent, urls received) for the coordinator. '''
+        with self.outbox_lock, self.lock:
+            idle = (
+                not self.tbd_count and not self.in_flight and not self.resume
+                and not any(self.outboxes.values()))
+            return idle, self.sent, self.received
+
+
+def _shard_config(config, shard_id):
+    config = copy.copy(config)
+    config.save_file = f"{config.save_file}.{shard_id}"
+    if config.metrics_file:
+        config.metrics_file = f"{config.metrics_file}.{shard_id}"
+    if config.metrics_port:
+        config.metrics_port += shard_id
+    if config.page_store:
+        config.page_store = os.path.join(config.page_store, f"shard-{shard_id}")
+    return config
+
+
+def run_shard(shard_id, config, restart, inboxes, statuses, results, stop):
+    ''' Entry point of a shard process. '''
+    frontier_factory = partial(
+        ShardFrontier, shard_id=shard_id, ring=HashRing(len(inboxes)),
+        inboxes=inboxes, stop=stop)
+    crawler = Crawler(
+        _shard_config(config, shard_id), restart,
+        frontier_factory=frontier_factory)
+    crawler.start_async()
+    frontier = crawler.frontier
+    sequence = 0
+    while not stop.wait(STATUS_INTERVAL):
+        frontier.flush_outboxes()
+        sequence += 1
+        statuses.put((shard_id, sequence) + frontier.status())
+    frontier.wake()
+    crawler.stop()
+    results.put((shard_id, summarize(frontier, all_words=True)))
+
+
+class ShardedCrawler(object):
+    ''' Crawl with `shard_count` local processes, each owning the hosts
+    the hash ring gives it, with its own frontier, save file, dedup and
+    politeness state. Urls found for another shard's hosts are forwarded
+    to it through a queue.
+
+    The crawl ends when every shard is idle and every forwarded url has
+    been received. This must hold in two consecutive rounds of status
+    reports with unchanged counts, so a batch in transit cannot be
+    missed. The shards' analytics are merged into one report.
+    '''
+
+    def __init__(self, config, restart, shard_count):
+        self.config = config
+        self.restart = restart
+        self.shard_count = shard_count
+        self.logger = get_logger("CRAWLER")
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        inboxes = [context.Queue() for _ in range(self.shard_count)]
+        statuses = context.Queue()
+        results = context.Queue()
+        stop = context.Event()
+        shards = [
+            context.Process(
+                target=run_shard,
+                args=(shard_id, self.config, self.restart, inboxes,
+                      statuses, results, stop))
+            for shard_id in range(self.shard_count)]
+        for shard in shards:
+            shard.start()
+        self._wait_until_done(shards, statuses)
+        stop.set()
+        summaries = dict()
+        while len(summaries) < len(shards):
+            try:
+                shard_id, summary = results.get(timeout=1)
+            except Empty:
+                if not any(shard.is_alive() for shard in shards):
+                    break
+                continue
+            summaries[shard_id] = summary
+        for shard in shards:
+            shard.join()
+        self.logger.info(f"All {self.shard_count} shards stopped.")
+        print_summary(merge_summaries(list(summaries.values())))
+
+    def _wait_until_done(self, shards, statuses):
+        latest = dict()
+        candidate = None
+        while True:
+            try:
+                shard_id, sequence, idle, sent, received = statuses.get(timeout=1)
+                latest[shard_id] = (sequence, idle, sent, received)
+            except Empty:
+                pass
+            if not all(shard.is_alive() for shard in shards):
+                self.logger.error("A shard exited early, stopping the crawl.")
+                return
+            if len(latest) < len(shards):
+                continue
+            totals = (
+                sum(status[2] for status in latest.values()),
+                sum(status[3] for status in latest.values()))
+            if not all(status[1] for status in latest.values()) or totals[0] != totals[1]:
+                candidate = None
+            elif candidate is None or candidate[0] != totals:
+                candidate = (totals, {
+                    shard_id: status[0] for shard_id, status in latest.items()})
+            elif all(latest[shard_id][0] > sequence
+                     for shard_id, sequence in candidate[1].items()):
+                return
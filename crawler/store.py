@@ -0,0 +1,263 @@
+import sqlite3
+
+from collections import namedtuple
+from threading import Thread, Lock, Event
+
+from utils.metrics import metrics
+
+# One row of the save file. content_hash, fetched (unix time) and
+# interval (seconds until a recrawl is due) are set once a url is crawled.
+UrlRecord = namedtuple(
+    "UrlRecord",
+    ["url", "completed", "score", "depth", "content_hash", "fetched", "interval"],
+    defaults=(0.0, 0, None, None, None))
+
+# Columns added after the first save file format, with their definitions.
+ADDED_COLUMNS = (
+    ("score", "REAL NOT NULL DEFAULT 0"),
+    ("depth", "INTEGER NOT NULL DEFAULT 0"),
+    ("content_hash", "TEXT"),
+    ("fetched", "REAL"),
+    ("interval", "REAL"))
+COLUMNS = ", ".join(UrlRecord._fields)
+# When a completed url is due for a recrawl.
+DUE = "IFNULL(fetched, 0) + IFNULL(interval, 0)"
+# Writers flush themselves once this many windows are pending, which only
+# happens when the flusher thread falls behind.
+MAX_PENDING_WINDOWS = 4
+
+
+class FrontierStore(object):
+    ''' Write-behind replacement for the frontier shelve.
+
+    Mutations are kept in memory and written to SQLite (WAL mode) in one
+    transaction once flush_size of them are pending or flush_interval
+    seconds have passed, whichever comes first. Each flush is atomic and
+    applied in order, so a crash loses at most the last window and never
+    records a url as complete without the urls it discovered. SQLite
+    replays its write-ahead log when the file is opened again.
+
+    Supports the parts of the shelve mapping interface the frontier uses:
+    store[urlhash] = UrlRecord(...), `in`, len(), keys() and values().
+    values() returns rows in the order they were first added. incomplete()
+    and due() read the urls to resume a crawl with a batch at a time,
+    from partial indexes, so resuming does not scan every row.
+
+    before_flush, if set, is called before every flush and returns a
+    function that is called after it, with whether the flush committed.
+    Flushes run one at a time. on_swap, if set, is called with the pending
+    writes locked when a flush takes them, so it sees exactly what put()
+    did for the writes being flushed.
+
+    Flushes run in a background thread, and a flush swaps the pending
+    writes out before it writes them, so writers never wait for SQLite.
+    Writes in flight are still visible to lookups.
+    '''
+
+    def __init__(self, path, flush_size=500, flush_interval=2.0, logger=None):
+        self.logger = logger
+        self.before_flush = None
+        self.on_swap = None
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        # lock guards the pending writes, db_lock the connection.
+        self.lock = Lock()
+        self.db_lock = Lock()
+        self.flush_lock = Lock()
+        self.pending = dict()
+        self.flushing = dict()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, "
+            "completed INTEGER NOT NULL)")
+        columns = {
+            row[1] for row in self.conn.execute("PRAGMA table_info(urls)")}
+        # Also upgrades save files written by older versions.
+        for column, definition in ADDED_COLUMNS:
+            if column not in columns:
+                self.conn.execute(
+                    f"ALTER TABLE urls ADD COLUMN {column} {definition}")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS pending_urls ON urls (-score) "
+            "WHERE completed = 0")
+        self.conn.execute(
+            f"CREATE INDEX IF NOT EXISTS due_urls ON urls ({DUE}) "
+            f"WHERE completed = 1")
+        self.conn.commit()
+        self.closed = Event()
+        self.full = Event()
+        self.flusher = Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            self.full.wait(self.flush_interval)
+            self.full.clear()
+            if self.closed.is_set():
+                return
+            try:
+                self.flush()
+            except Exception:
+                # The writes stay pending for the next flush.
+                if self.logger:
+                    self.logger.exception("Could not flush the save file.")
+
+    def flush(self):
+        with self.flush_lock:
+            after = self.before_flush() if self.before_flush else None
+            try:
+                self._flush()
+            except Exception:
+                if after:
+                    after(False)
+                raise
+            if after:
+                after(True)
+
+    def _flush(self):
+        with self.db_lock:
+            with self.lock:
+                if not self.pending:
+                    return
+                self.flushing, self.pending = self.pending, dict()
+                if self.on_swap:
+                    self.on_swap()
+            rows = [
+                (urlhash,) + record._replace(completed=int(record.completed))
+                for urlhash, record in self.flushing.items()]
+            try:
+                with metrics.timer("store.flush"), self.conn:
+                    self.conn.executemany(
+                        f"INSERT INTO urls (urlhash, {COLUMNS}) "
+                        f"VALUES (?{', ?' * len(UrlRecord._fields)}) "
+                        f"ON CONFLICT (urlhash) DO UPDATE SET "
+                        + ", ".join(
+                            f"{column} = excluded.{column}"
+                            for column in UrlRecord._fields), rows)
+            except Exception:
+                # Keep the writes for the next flush, newest last.
+                with self.lock:
+                    self.flushing.update(self.pending)
+                    self.pending, self.flushing = self.flushing, dict()
+                raise
+            with self.lock:
+                self.flushing = dict()
+
+    def __setitem__(self, urlhash, value):
+        self.put(urlhash, value)
+
+    def put(self, urlhash, value, before=None):
+        ''' store[urlhash] = value, calling `before` first with the pending
+        writes locked, so a flush takes both or neither (see on_swap). '''
+        with self.lock:
+            if before:
+                before()
+            self.pending[urlhash] = value
+            size = len(self.pending)
+        if size >= self.flush_size * MAX_PENDING_WINDOWS:
+            self.flush()
+        elif size >= self.flush_size:
+            self.full.set()
+
+    def __getitem__(self, urlhash):
+        with self.lock:
+            record = self.pending.get(urlhash) or self.flushing.get(urlhash)
+        if record is not None:
+            return record
+        with self.db_lock:
+            row = self.conn.execute(
+                f"SELECT {COLUMNS} FROM urls WHERE urlhash = ?",
+                (urlhash,)).fetchone()
+        if row is None:
+            raise KeyError(urlhash)
+        return self._record(row)
+
+    @staticmethod
+    def _record(row):
+        record = UrlRecord._make(row)
+        return record._replace(completed=bool(record.completed))
+
+    def __contains__(self, urlhash):
+        try:
+            self[urlhash]
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        self.flush()
+        with self.db_lock:
+            return self.conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def keys(self):
+        self.flush()
+        with self.db_lock:
+            rows = self.conn.execute("SELECT urlhash FROM urls").fetchall()
+        for urlhash, in rows:
+            yield urlhash
+
+    def values(self):
+        self.flush()
+        with self.db_lock:
+            rows = self.conn.execute(
+                f"SELECT {COLUMNS} FROM urls ORDER BY rowid").fetchall()
+        for row in rows:
+            yield self._record(row)
+
+    def last_rowid(self):
+        self.flush()
+        with self.db_lock:
+            return self.conn.execute("SELECT MAX(rowid) FROM urls").fetchone()[0] or 0
+
+    def count_incomplete(self):
+        with self.db_lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM urls WHERE completed = 0").fetchone()[0]
+
+    def count_due(self, now):
+        with self.db_lock:
+            return self.conn.execute(
+                f"SELECT COUNT(*) FROM urls WHERE completed = 1 AND {DUE} <= ?",
+                (now,)).fetchone()[0]
+
+    def _batch(self, key, where, cursor, last, limit, params=()):
+        ''' Up to `limit` rows matching `where` with rowid <= last, ordered
+        by (key, rowid) and following `cursor`, the (key, rowid) of the
+        last row of the previous batch. Returns [(cursor, UrlRecord)].
+        Two range queries, so every batch costs the same however far
+        into the index it is. '''
+        select = (
+            f"SELECT {key}, rowid, {COLUMNS} FROM urls "
+            f"WHERE {where} AND rowid <= ? AND ")
+        rows = list()
+        with self.db_lock:
+            if cursor is not None:
+                rows = self.conn.execute(
+                    select + f"{key} = ? AND rowid > ? ORDER BY rowid LIMIT ?",
+                    params + (last,) + cursor + (limit,)).fetchall()
+            rows += self.conn.execute(
+                select + f"{key} > ? ORDER BY {key}, rowid LIMIT ?",
+                params + (last, cursor[0] if cursor else float("-inf"),
+                          limit - len(rows))).fetchall()
+        return [(row[:2], self._record(row[2:])) for row in rows]
+
+    def incomplete(self, cursor, last, limit):
+        ''' Incomplete urls, best score first. '''
+        return self._batch("-score", "completed = 0", cursor, last, limit)
+
+    def due(self, now, cursor, last, limit):
+        ''' Completed urls due for a recrawl at `now`, most overdue first. '''
+        return self._batch(
+            DUE, f"completed = 1 AND {DUE} <= ?", cursor, last, limit, (now,))
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.full.set()
+        self.flusher.join()
+        self.flush()
+        self.conn.close()
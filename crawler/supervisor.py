@@ -0,0 +1,108 @@
+import math
+
+from threading import Thread, Event
+
+from utils import get_logger
+from utils.metrics import metrics
+
+# Downloads are held back once the parse queue is this full.
+PARSE_BACKLOG = 0.75
+# Resize by at most this fraction of the pool per interval.
+MAX_STEP = 0.25
+
+
+def target_workers(current, hosts, ready_hosts, waiting, latency, delay,
+                   backlog, low, high):
+    ''' Number of workers to run next.
+
+    Every host hands out a url once per politeness `delay` and a worker
+    spends about `latency` seconds on a download, so by Little's law
+    hosts * latency / delay workers keep every host busy. The pool only
+    grows while hosts are ready and no worker is waiting for a url, and
+    shrinks while the parse queue is `backlog` full, since more downloads
+    would only wait for a parse process. Moves at most MAX_STEP of the
+    pool at a time, within [low, high].
+    '''
+    if latency is None:
+        wanted = current
+    elif delay <= 0:
+        wanted = high
+    else:
+        wanted = math.ceil(hosts * latency / delay)
+    if wanted > current and (not ready_hosts or waiting):
+        wanted = current
+    if backlog >= PARSE_BACKLOG:
+        wanted = current - 1
+    step = max(1, int(current * MAX_STEP))
+    wanted = max(current - step, min(current + step, wanted))
+    return max(low, min(high, wanted))
+
+
+class WorkerSupervisor(Thread):
+    ''' Resizes the worker pool of a Crawler between config.min_threads and
+    config.max_threads every config.scale_interval seconds, from the
+    download latency of the last interval, the number of hosts with work
+    and how many of them are ready, the workers waiting for a url and the
+    parse queue. Workers are retired newest first. Returns once every
+    worker has stopped, which they do when the frontier is finished.
+    '''
+
+    def __init__(self, crawler):
+        self.logger = get_logger("SUPERVISOR")
+        self.crawler = crawler
+        self.config = crawler.config
+        self.frontier = crawler.frontier
+        self.stopped = Event()
+        self.downloads = (0, 0.0)
+        metrics.gauge("workers", lambda: len(self.active()))
+        super().__init__(daemon=True)
+
+    def active(self):
+        return [
+            worker for worker in self.crawler.workers
+            if worker.is_alive() and not worker.retired.is_set()]
+
+    def latency(self):
+        ''' Mean download time since the last call, None without downloads. '''
+        timer = metrics.snapshot()["timers"].get("download")
+        if not timer:
+            return None
+        count, total = self.downloads
+        self.downloads = (timer["count"], timer["total"])
+        if timer["count"] == count:
+            return None
+        return (timer["total"] - total) / (timer["count"] - count)
+
+    def backlog(self):
+        pipeline = self.crawler.pipeline
+        if not pipeline:
+            return 0.0
+        return pipeline.outstanding / self.config.parse_queue_size
+
+    def run(self):
+        while not self.stopped.wait(self.config.scale_interval):
+            if not any(worker.is_alive() for worker in self.crawler.workers):
+                break
+            if self.frontier.finished():
+                continue
+            workers = self.active()
+            current = len(workers)
+            target = target_workers(
+                current, len(self.frontier.host_queues),
+                self.frontier.ready_host_count(), self.frontier.waiting,
+                self.latency(), self.config.time_delay, self.backlog(),
+                self.config.min_threads, self.config.max_threads)
+            if target == current:
+                continue
+            self.logger.info(f"Resizing the worker pool from {current} to {target}.")
+            metrics.count("workers.resized")
+            if target > current:
+                for _ in range(target - current):
+                    self.crawler.add_worker()
+            else:
+                for worker in workers[target - current:]:
+                    worker.retire()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
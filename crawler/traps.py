@@ -0,0 +1,146 @@
+''' Crawler trap detection from what the pages of a url pattern yield.
+
+Urls are grouped by host and path template: the path with every run of
+digits collapsed to {n} and every hex id or uuid to {id}, so the pages of
+a calendar, a paginated listing or a revision history share a template.
+For each template the detector counts the crawled pages and how many of
+them gave no new content: exact duplicates, near duplicates and pages
+with too little text. Once a template has min_pages pages, new urls of
+it are throttled while that rate is at least `throttle`, only one in
+THROTTLE_EVERY distinct urls is admitted, and banned while it is at least
+`ban`. A throttled url is judged once: trap pages link to each other over
+and over, and a url rejected on one page must stay rejected when the next
+one offers it again. Urls of a banned template that were queued before
+the ban are skipped when they come up. Counts are halved every WINDOW
+pages, so the rate follows what a template yields lately.
+
+This complements the per-link checks in scraper.filter_link, which drop
+links within two characters of the page they are on and links with too
+many slashes. Those act before a single page of a trap is fetched and
+catch what a template cannot: sibling urls differing in a letter, and
+paths that grow by repeating segments, which give a new template at
+every depth. The detector needs min_pages pages of a template before it
+acts, but it catches what they cannot: traps whose urls differ by more
+than two characters and stay shallow, like calendars and listings.
+'''
+import heapq
+import hashlib
+import pickle
+import re
+
+from threading import Lock
+from urllib.parse import urlparse
+
+# Hex ids and uuids with at least one digit, as a whole path segment.
+IDENTIFIER_RE = re.compile(r"^(?=[^/]*\d)[0-9a-f-]{8,}$")
+DIGITS_RE = re.compile(r"\d+")
+# A throttled template gets one of this many of its new urls crawled.
+THROTTLE_EVERY = 4
+# Pages after which a template's counts are halved.
+WINDOW = 200
+# What merge_page reports for a page that gave no new content.
+USELESS = ("duplicate", "near_duplicate", "low_text")
+
+
+def template(url):
+    ''' Host and path of url, with numbers and ids collapsed. '''
+    parsed = urlparse(url)
+    segments = list()
+    for segment in parsed.path.lower().split("/"):
+        if IDENTIFIER_RE.match(segment):
+            segments.append("{id}")
+        else:
+            segments.append(DIGITS_RE.sub("{n}", segment))
+    return parsed.netloc.lower() + "/".join(segments)
+
+
+class TemplateStats(object):
+    def __init__(self):
+        self.pages = 0
+        self.outcomes = dict()
+        self.offered = 0
+        # Whether each url offered while throttled was admitted, by digest.
+        self.verdicts = dict()
+
+    @property
+    def useless(self):
+        return sum(self.outcomes.get(outcome, 0) for outcome in USELESS)
+
+    def rate(self):
+        return self.useless / self.pages if self.pages else 0.0
+
+    def record(self, outcome):
+        self.pages += 1
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        if self.pages >= WINDOW:
+            self.pages //= 2
+            self.outcomes = {
+                outcome: count // 2 for outcome, count in self.outcomes.items()}
+
+
+class TrapDetector(object):
+    ''' Per-host url template statistics, see the module docstring. The
+    frontier checkpoints them with state() and restore(), so a resumed
+    crawl keeps them. '''
+
+    def __init__(self, min_pages=10, throttle=0.5, ban=0.9):
+        self.min_pages = min_pages
+        self.throttle = throttle
+        self.ban = ban
+        self.lock = Lock()
+        self.templates = dict()
+
+    def _judged(self, stats):
+        ''' Useless rate of a template with enough pages, else None. '''
+        if stats is None or stats.pages < self.min_pages:
+            return None
+        return stats.rate()
+
+    def admit(self, url):
+        ''' Whether a newly found url should be crawled. '''
+        key = template(url)
+        with self.lock:
+            stats = self.templates.get(key)
+            rate = self._judged(stats)
+            if rate is None or rate < self.throttle:
+                return True
+            if rate >= self.ban:
+                return False
+            digest = hashlib.blake2b(url.encode(), digest_size=8).digest()
+            verdict = stats.verdicts.get(digest)
+            if verdict is None:
+                stats.offered += 1
+                verdict = stats.verdicts[digest] = stats.offered % THROTTLE_EVERY == 1
+            return verdict
+
+    def banned(self, url):
+        ''' Whether the template of a queued url has been banned since. '''
+        with self.lock:
+            rate = self._judged(self.templates.get(template(url)))
+        return rate is not None and rate >= self.ban
+
+    def record(self, url, outcome):
+        ''' Count a crawled page: "new", or one of USELESS. '''
+        key = template(url)
+        with self.lock:
+            stats = self.templates.get(key)
+            if stats is None:
+                stats = self.templates[key] = TemplateStats()
+            stats.record(outcome)
+
+    def worst(self, count=10):
+        ''' Useless rates of the judged templates with the highest ones. '''
+        with self.lock:
+            rates = [
+                (stats.rate(), key) for key, stats in self.templates.items()
+                if stats.pages >= self.min_pages]
+        return {key: round(rate, 2) for rate, key in heapq.nlargest(count, rates)}
+
+    def state(self):
+        ''' The statistics, pickled, since they keep changing. '''
+        with self.lock:
+            return pickle.dumps(self.templates, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def restore(self, state):
+        with self.lock:
+            self.templates = pickle.loads(state)
@@ -1,17 +1,31 @@
 from configparser import ConfigParser
 from argparse import ArgumentParser
 
-from utils.server_registration import get_cache_server
 from utils.config import Config
 from crawler import Crawler
 
 
-def main(config_file, restart):
+def main(config_file, restart, engine, cache_server=None, shards=1,
+         recrawl=False):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
+    config.recrawl = recrawl
+    if cache_server:
+        # A local cache such as benchmarks.stub_server, no registration.
+        host, port = cache_server.rsplit(":", 1)
+        config.cache_server = (host, int(port))
+    else:
+        from utils.server_registration import get_cache_server
+        config.cache_server = get_cache_server(config, restart)
+    if shards > 1:
+        from crawler.sharding import ShardedCrawler
+        crawler = ShardedCrawler(config, restart, shards)
+    elif engine == "async":
+        from crawler.async_crawler import AsyncCrawler
+        crawler = AsyncCrawler(config, restart)
+    else:
+        crawler = Crawler(config, restart)
     crawler.start()
 
 
@@ -19,5 +33,21 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument(
+        "--engine", choices=["threads", "async"], default="threads")
+    parser.add_argument(
+        "--cache_server", type=str, default=None, metavar="HOST:PORT")
+    parser.add_argument(
+        "--shards", type=int, default=1,
+        help="crawl with this many local processes, split by host")
+    parser.add_argument(
+        "--recrawl", action="store_true", default=False,
+        help="also crawl completed urls that are due for a refresh")
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    if args.recrawl and args.restart:
+        parser.error("--recrawl refreshes an existing crawl, drop --restart")
+    if args.shards > 1 and args.engine != "threads":
+        parser.error("--shards runs the threads engine in every shard")
+    main(
+        args.config_file, args.restart, args.engine, args.cache_server,
+        args.shards, args.recrawl)
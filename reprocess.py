@@ -0,0 +1,112 @@
+import glob
+import multiprocessing
+import os
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from configparser import ConfigParser
+
+from utils import get_logger
+from utils.config import Config
+from utils.content_hashes import ContentHashSet
+from utils.metrics import metrics
+from utils.page_store import PageStore, SegmentReader
+from utils.simhash_index import SimhashIndex
+from utils.thread_stats import Tally, Longest
+from utils.word_stats import WordStats
+from crawler.report import TOP_WORDS, summarize, print_summary
+import scraper
+
+# Readers of the worker process, by store directory.
+_readers = dict()
+
+
+class Analytics(object):
+    ''' Stands in for the frontier in scraper.merge_page, keeping only
+    the analytics the report needs. Unique pages are the stored pages. '''
+
+    def __init__(self, config):
+        self.seen = set()
+        self.fingerprints = ContentHashSet()
+        self.sim_fingerprints = SimhashIndex()
+        self.word_counts = WordStats(
+            config.word_budget, max(config.top_words, TOP_WORDS))
+        self.longest = Longest()
+        self.subdomains = Tally()
+
+    def known_hash(self, url):
+        return None
+
+    def set_content_hash(self, url, content_hash):
+        pass
+
+    def set_text_ratio(self, url, text_ratio):
+        pass
+
+    def count_page(self, url, counts):
+        if counts.subdomain:
+            self.subdomains.add(counts.subdomain)
+        if counts.word_count:
+            self.longest.offer(url, counts.word_count)
+        if counts.word_freq:
+            self.word_counts.update(counts.word_freq)
+
+
+def store_directories(page_store):
+    ''' The store and, after a --shards crawl, the store of every shard. '''
+    directories = sorted(glob.glob(os.path.join(page_store, "shard-*")))
+    if os.path.exists(os.path.join(page_store, "pages.index")):
+        directories.insert(0, page_store)
+    return directories
+
+
+def _analyze(task):
+    directory, location = task
+    reader = _readers.get(directory)
+    if reader is None:
+        reader = _readers[directory] = SegmentReader(directory)
+    url, html = reader.read(*location)
+    return url, scraper.analyze_page(url, html)
+
+
+def reprocess(config, processes=None):
+    ''' Run every stored page through the scraper analytics, in the order
+    they were downloaded, and return the analytics. Pages are read and
+    analyzed by a process pool straight from the segment files; only
+    their locations and the compact results cross process boundaries. '''
+    logger = get_logger("REPROCESS")
+    analytics = Analytics(config)
+    tasks = list()
+    for directory in store_directories(config.page_store):
+        store = PageStore(directory, config.page_compression)
+        tasks.extend((directory, location) for location in store.locations())
+        store.close()
+    logger.info(f"Reprocessing {len(tasks)} stored pages.")
+    with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn")) as pool:
+        for url, page in pool.map(_analyze, tasks, chunksize=32):
+            analytics.seen.add(url)
+            with metrics.timer("merge"):
+                scraper.merge_page(url, page, analytics)
+    return analytics
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument(
+        "--page_store", type=str, default=None,
+        help="directory of the page store, PAGESTORE by default")
+    parser.add_argument(
+        "--processes", type=int, default=None,
+        help="parse processes, one per core by default")
+    args = parser.parse_args()
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    config = Config(cparser)
+    if args.page_store:
+        config.page_store = args.page_store
+    if not config.page_store:
+        parser.error("set PAGESTORE in the config file or pass --page_store")
+    print_summary(summarize(reprocess(config, args.processes)))
@@ -1,9 +1,44 @@
 import re
+from collections import namedtuple, Counter
+from functools import lru_cache
 from urllib.parse import urlparse, urljoin, urlunparse
-from urllib import robotparser
-from bs4 import BeautifulSoup
 from hashlib import sha256
 from simhash import Simhash
+from utils.html_extract import extract
+from utils.metrics import metrics
+
+#Tokens are runs of a-z, 0-9 and ' after lowercasing, at least 3 long
+TOKEN_RE = re.compile(r"[a-z0-9']{3,}")
+#A shorter run is still kept when it ends the text
+LAST_SHORT_TOKEN_RE = re.compile(r"(?<![a-z0-9'])[a-z0-9']{1,2}\Z")
+
+#Paths with these file extensions are not web pages
+EXTENSION_RE = re.compile(
+    r".*\.(css|js|bmp|gif|jpe?g|ico"
+    + r"|png|tiff?|mid|mp2|mp3|mp4"
+    + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+    + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+    + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+    + r"|epub|dll|cnf|tgz|sha1"
+    + r"|thmx|mso|arff|rtf|jar|csv"
+    + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$")
+VALID_SCHEMES = frozenset(["http", "https"])
+VALID_DOMAINS = frozenset(['ics.uci.edu',
+                           'cs.uci.edu',
+                           'informatics.uci.edu',
+                           'stat.uci.edu'])
+
+#Compact result of parsing a page, small enough to send between processes
+#unchanged is set when a recrawled page has the same content as last time
+Page = namedtuple('Page', ['nofollow', 'content_hash', 'simhash', 'text_length',
+                           'html_length', 'word_count', 'word_freq', 'links',
+                           'unchanged'], defaults=(False,))
+
+#What a merged page adds to the report. The frontier applies it when the page
+#is recorded complete, so the analytics saved with the save file never count
+#a page the save file would crawl again
+PageCounts = namedtuple('PageCounts', ['subdomain', 'outcome', 'word_count',
+                                       'word_freq'], defaults=(None, 0, None))
 
 def scraper(url, resp, frontier):
     return extract_next_links(url, resp, frontier)
@@ -23,86 +58,149 @@ def extract_next_links(url, resp, frontier):
     if resp.status != 200:
         return list()
 
-    #Add to ics.uci.edu subdomain dictionary
-    if is_subdomain_of('ics.uci.edu', url):
-        frontier.subdomains[root(url).lower()] = frontier.subdomains.get(root(url).lower(), 0) + 1
-
-    #Parse html content
-    soup = BeautifulSoup(resp.raw_response.content, 'lxml')
-    
-    #Check meta robots tag
-    robots_meta_tag = soup.find("meta", {"name": "robots"})
-    if robots_meta_tag:
-        #Extract the content attribute value
-        content = robots_meta_tag.get("content").split(',')
-        if "nofollow" in content:
-            return list()
-
-    text_content = soup.get_text()
-
-    #Handle duplicate content
-    content_hash = sha256(text_content.encode()).hexdigest()
-    if content_hash in frontier.fingerprints:
-        return list()
-    frontier.fingerprints.add(content_hash)
+    page = analyze_page(url, resp.raw_response.content, frontier.known_hash(url))
+    return merge_page(url, page, frontier)
 
-    #Handle similar content
-    simhash = Simhash(text_content)
-    max_hash_bits = len(bin(simhash.value))
-    for sim in frontier.sim_fingerprints:
-        similarity = simhash.distance(Simhash(sim)) / max_hash_bits
-        if similarity < 0.025:
-            return list()
-    frontier.sim_fingerprints.add(simhash.value)
+def analyze_page(url, html, known_hash=None):
+    """
+    Parse a page without touching the frontier, so it can run in another process.
+    If the text hashes to known_hash, the rest of the work is skipped
+    """
+    #Parse html content in one pass, stopping early if meta robots says nofollow
+    with metrics.timer("extract"):
+        extracted = extract(html)
+    if extracted.nofollow:
+        metrics.count("nofollow")
+        return Page(True, None, None, 0, 0, 0, None, None)
+
+    text_content = extracted.text
+
+    with metrics.timer("fingerprint"):
+        content_hash = sha256(text_content.encode()).hexdigest()
+        if content_hash == known_hash:
+            return Page(False, content_hash, None, len(text_content), len(html),
+                        0, None, None, True)
+        simhash = Simhash(text_content)
+
+    #Tokenize content and count words
+    with metrics.timer("tokenize"):
+        tokens = tokenize(text_content)
+        token_freq = computeWordFrequencies(tokens)
+
+    #Extract the URLs from the <a href>s and reformat
+    with metrics.timer("links"):
+        link_urls = extract_links(url, extracted.hrefs)
+
+    return Page(False, content_hash, simhash.value, len(text_content), len(html),
+                len(tokens), token_freq, link_urls)
+
+def extract_links(url, hrefs):
+    """
+    Resolve and filter the hrefs of a page, returning the urls to crawl
+    """
+    link_urls = []
+    #Menus and footers repeat the same hrefs, so decide each one once
+    verdicts = {}
+    for href in hrefs:
+        link = verdicts.get(href)
+        if link is None:
+            link = verdicts[href] = filter_link(url, href)
+        if link:
+            link_urls.append(link)
 
-    #Check content to html ration to see if page has high textual content
-    text_content_len = len(text_content)
-    html_content_len = len(resp.raw_response.content)
+    return link_urls
 
-    ratio =  text_content_len / html_content_len
-    if html_content_len == 0 or ratio < .01:
-        return list()
+def filter_link(url, href):
+    """
+    Return the canonical link for an href found on url, or False if it should not be crawled
+    """
+    #Get link
+    link = href.strip()
+    #If fragment don't bother
+    if not link or link[0] == '#':
+        pass
+    elif link.startswith('//'):
+        link = 'https:' + link
+    elif link.startswith('/'):
+        link = urljoin(url, link)
+    #Remove query and fragment from link to avoid repetitive information
+    try:
+        parsed = urlparse(link)._replace(fragment='',query='')
+        link = urlunparse(parsed)
+        #Without a netloc urlunparse can move part of the path into one
+        if not parsed.netloc:
+            parsed = urlparse(link)
+    except ValueError:
+        return False
+    #Add url to link list if it is valid and can be crawled. Links close to
+    #their page and very deep links are cut before any of them is fetched,
+    #which crawler/traps.py cannot do, as it judges a pattern by its pages
+    if is_valid_parsed(parsed) and not urls_differ_by_at_most_n_chars(2, url, link) and not has_too_many_slashes(link, 12):
+        return link
+    return False
+
+def merge_page(url, page, frontier):
+    """
+    Record an analyzed page in the frontier and return the links to crawl
+    """
+    links, counts = _merge_page(url, page, frontier)
+    frontier.count_page(url, counts)
+    return links
 
+def _merge_page(url, page, frontier):
+    """
+    merge_page, returning the links and the PageCounts of the page
+    """
+    #A recrawled page was counted on its first crawl
+    recrawled = frontier.known_hash(url) is not None
 
-    #Tokenize content and keep track of max words in frontier
-    tokens = tokenize(text_content)
-    if len(tokens) > frontier.max_words:
-        frontier.max_words = len(tokens)
-        frontier.max_words_url = url
-    
-    #Update word count for all pages
-    token_freq = computeWordFrequencies(tokens)
-    for key, value in token_freq.items():
-        frontier.word_counts[key] = frontier.word_counts.get(key, 0) + value
+    #Add to ics.uci.edu subdomain dictionary
+    subdomain = None
+    if not recrawled and is_subdomain_of('ics.uci.edu', url):
+        subdomain = root(url).lower()
+
+    if page.nofollow:
+        return list(), PageCounts(subdomain)
+
+    frontier.set_content_hash(url, page.content_hash)
+    #Nothing to update for a recrawled page that did not change
+    if page.unchanged:
+        metrics.count("recrawl.unchanged")
+        return list(), PageCounts(subdomain)
+
+    #A recrawled page that changed is not checked against the fingerprints
+    #of its own last crawl, which would take most edits for near duplicates.
+    #It is not reported to the trap detector either
+
+    #Handle duplicate content, checking and adding in one step so two
+    #threads with the same page cannot both keep it
+    with metrics.timer("dedup"):
+        if recrawled:
+            frontier.fingerprints.add(page.content_hash)
+            frontier.sim_fingerprints.add(page.simhash)
+        elif not frontier.fingerprints.add(page.content_hash):
+            metrics.count("duplicates")
+            return list(), PageCounts(subdomain, "duplicate")
+        #Handle similar content
+        elif not frontier.sim_fingerprints.add_new(page.simhash):
+            metrics.count("near_duplicates")
+            return list(), PageCounts(subdomain, "near_duplicate")
 
-    #Get all <a hrefs>s
-    link_tags = soup.find_all('a', href=True)
+    #Check content to html ration to see if page has high textual content
+    if page.html_length == 0 or page.text_length / page.html_length < .01:
+        metrics.count("low_text")
+        return list(), PageCounts(subdomain, None if recrawled else "low_text")
+    #Links found on pages with more text can be crawled sooner
+    frontier.set_text_ratio(url, page.text_length / page.html_length)
 
-    #Extract the URLs from the anchor tags and reformat
-    link_urls = []
-    for link in link_tags:
-        #If no follow in href don't crawl
-        if link.get('rel') == 'nofollow':
-            continue
-        #Get link
-        link = link.get('href').strip()
-        #If fragment don't bother
-        if not link or link[0] == '#':
-            pass
-        elif link.startswith('//'):
-            link = 'https:' + link
-        elif link.startswith('/'):
-            link = urljoin(url, link)
-        #Remove query and fragment from link to avoid repetitive information
-        try:
-            link = urlunparse(urlparse(link)._replace(fragment='',query=''))
-        except ValueError:
-            continue
-        #Add url to link list if it is valid and can be crawled
-        if is_valid(link) and not urls_differ_by_at_most_n_chars(2, url, link) and not has_too_many_slashes(link, 12):
-            link_urls.append(link)
+    #Word counts count each page once, with the words of its first crawl, so
+    #the words of a changed page are not added again. Its word count still
+    #competes for the longest page
+    if recrawled:
+        metrics.count("recrawl.changed")
+        return page.links, PageCounts(subdomain, None, page.word_count)
 
-    return link_urls
+    return page.links, PageCounts(subdomain, "new", page.word_count, page.word_freq)
 
 def is_valid(url):
     # Decide whether to crawl this url or not. 
@@ -110,36 +208,35 @@ def is_valid(url):
     # There are already some conditions that return False.
     try:
         parsed = urlparse(url)
-        if parsed.scheme not in set(["http", "https"]):
-            return False
-
-        return not re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower()) and valid_domain(url)
+        return is_valid_parsed(parsed)
 
     except TypeError:
         print ("TypeError for ", parsed)
         raise
 
+def is_valid_parsed(parsed):
+    """
+    is_valid for a url that is already parsed
+    """
+    if parsed.scheme not in VALID_SCHEMES:
+        return False
+
+    return not EXTENSION_RE.match(parsed.path.lower()) and valid_netloc(parsed.netloc)
+
 def valid_domain(url):
-    valid_domains = {'ics.uci.edu',
-                    'cs.uci.edu',
-                    'informatics.uci.edu',
-                    'stat.uci.edu'}
+    return valid_netloc(urlparse(url).netloc)
 
-    parsed_url = urlparse(url)
-    domain = parsed_url.netloc.split('.')  
+@lru_cache(maxsize=4096)
+def valid_netloc(netloc):
+    """
+    Cached per host, since a crawl sees the same few hosts over and over
+    """
+    domain = netloc.split('.')
     if len(domain) < 3:
         return False
     #Get the last three parts of the domain
     domain = '.'.join(domain[-3:])
-    return domain in valid_domains
+    return domain in VALID_DOMAINS
 
 
 def is_root_url(url):
@@ -167,21 +264,12 @@ def tokenize(text_content) -> list["Token"]:
     """
     Tokenize the text file at the given path and return a list of tokens
     """
-    tokens = []
-   
-    #Build token and process token when encounter non alphanum char
-    token = ""
-    for char in text_content:
-        char = char.lower()
-        if (ord(char)>=97 and ord(char)<=122) or (ord(char)>=48 and ord(char)<=57) or ord(char)==39:
-            token += char
-        elif len(token)>=3:
-            tokens.append(token)
-            token = ""
-        else:
-            token = ""
-    if token:
-        tokens.append(token)
+    #Lowercase once and let the regex engine find the token runs
+    text_content = text_content.lower()
+    tokens = TOKEN_RE.findall(text_content)
+    last = LAST_SHORT_TOKEN_RE.search(text_content, max(len(text_content) - 3, 0))
+    if last:
+        tokens.append(last.group())
 
     return tokens
 
@@ -189,12 +277,10 @@ def computeWordFrequencies(tokens : list["Token"]) -> dict["Token", int]:
     """
     Compute the frequency of each word in the given list of tokens
     """
-    freq = {}
-
     # Count the frequency of each token
-    for token in tokens:
-        if not token in stopwords:
-            freq[token] = 1 + freq.get(token, 0)
+    freq = Counter(tokens)
+    for stopword in stopwords.intersection(freq):
+        del freq[stopword]
 
     return freq
 
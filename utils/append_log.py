@@ -0,0 +1,71 @@
+import os
+
+from threading import Lock
+
+
+class AppendLog(object):
+    ''' File of fixed-size records that only grows.
+
+    Appended records are buffered in memory until take() hands the oldest
+    of them out for write(), so the owner decides when they may reach the
+    disk. Records are numbered from the first one in the file; take(mark)
+    returns the buffered records numbered below mark.
+    '''
+
+    def __init__(self, path, record_size):
+        self.path = path
+        self.record_size = record_size
+        self.lock = Lock()
+        self.write_lock = Lock()
+        self.unsaved = bytearray()
+        data = b""
+        if os.path.exists(path):
+            with open(path, "rb") as log:
+                data = log.read()
+            whole = len(data) - len(data) % record_size
+            if whole < len(data):
+                # Cut a torn trailing record, so new records stay aligned.
+                data = data[:whole]
+                with open(path, "r+b") as log:
+                    log.truncate(whole)
+        self.loaded = data
+        self.taken = len(data) // record_size
+        self.file = open(path, "ab")
+
+    def records(self):
+        ''' The records that were in the file when it was opened. '''
+        data, self.loaded = self.loaded, b""
+        return data
+
+    def append(self, record):
+        with self.lock:
+            self.unsaved += record
+
+    def take(self, mark):
+        with self.lock:
+            count = min(
+                max(mark - self.taken, 0), len(self.unsaved) // self.record_size)
+            size = count * self.record_size
+            data = bytes(self.unsaved[:size])
+            del self.unsaved[:size]
+            self.taken += count
+        return data
+
+    def untake(self, data):
+        ''' Put back what the last take() returned, when it could not be
+        written. '''
+        with self.lock:
+            self.unsaved[:0] = data
+            self.taken -= len(data) // self.record_size
+
+    def write(self, data):
+        with self.write_lock:
+            if data and self.file:
+                self.file.write(data)
+                self.file.flush()
+
+    def close(self):
+        with self.write_lock:
+            if self.file:
+                self.file.close()
+                self.file = None
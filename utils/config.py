@@ -8,12 +8,37 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.min_threads = int(config["LOCAL PROPERTIES"].get("MINTHREADS", str(self.threads_count)))
+        self.max_threads = int(config["LOCAL PROPERTIES"].get("MAXTHREADS", str(self.threads_count)))
+        self.scale_interval = float(config["LOCAL PROPERTIES"].get("SCALEINTERVAL", "5"))
+        self.concurrency = int(config["LOCAL PROPERTIES"].get("CONCURRENCY", "200"))
+        self.parse_processes = int(config["LOCAL PROPERTIES"].get("PARSEPROCESSES", "0"))
+        self.parse_queue_size = int(config["LOCAL PROPERTIES"].get("PARSEQUEUE", "64"))
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.flush_size = int(config["LOCAL PROPERTIES"].get("FLUSHSIZE", "500"))
+        self.flush_interval = float(config["LOCAL PROPERTIES"].get("FLUSHINTERVAL", "2"))
+        self.word_budget = int(config["LOCAL PROPERTIES"].get("WORDBUDGET", "200000"))
+        self.top_words = int(config["LOCAL PROPERTIES"].get("TOPWORDS", "50"))
+        self.metrics_file = config["LOCAL PROPERTIES"].get("METRICSFILE", "").strip()
+        self.metrics_port = int(config["LOCAL PROPERTIES"].get("METRICSPORT", "0"))
+        self.metrics_interval = float(config["LOCAL PROPERTIES"].get("METRICSINTERVAL", "10"))
+        self.page_store = config["LOCAL PROPERTIES"].get("PAGESTORE", "").strip()
+        self.page_compression = config["LOCAL PROPERTIES"].get("PAGECOMPRESSION", "zlib").strip()
+        self.segment_size = int(config["LOCAL PROPERTIES"].get("SEGMENTSIZE", "256")) << 20
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.scorer = config["CRAWLER"].get("SCORER", "default").strip()
+        self.robots_ttl = float(config["CRAWLER"].get("ROBOTSTTL", "86400"))
+
+        self.recrawl_interval = float(config["CRAWLER"].get("RECRAWLINTERVAL", "86400"))
+        self.trap_min_pages = int(config["CRAWLER"].get("TRAPMINPAGES", "10"))
+        self.trap_throttle = float(config["CRAWLER"].get("TRAPTHROTTLE", "0.5"))
+        self.trap_ban = float(config["CRAWLER"].get("TRAPBAN", "0.9"))
+        # Set by launch.py --recrawl.
+        self.recrawl = False
 
         self.cache_server = None
\ No newline at end of file
@@ -0,0 +1,64 @@
+from threading import Lock
+
+from utils.append_log import AppendLog
+
+DIGEST_SIZE = 16
+
+
+class ContentHashSet(object):
+    ''' Set of the sha256 content hashes of crawled pages, for exact
+    duplicate detection. Keeps the first 16 bytes of each hex hash. With
+    a `path`, hashes are kept in an AppendLog like SimhashIndex does. '''
+
+    def __init__(self, path=None):
+        self.lock = Lock()
+        self.hashes = set()
+        # Hashes added, numbered like the records of the log.
+        self.count = 0
+        self.log = None
+        if path:
+            self.log = AppendLog(path, DIGEST_SIZE)
+            data = self.log.records()
+            self.hashes.update(
+                data[start:start + DIGEST_SIZE]
+                for start in range(0, len(data), DIGEST_SIZE))
+            self.count = len(data) // DIGEST_SIZE
+
+    @staticmethod
+    def _digest(content_hash):
+        return bytes.fromhex(content_hash)[:DIGEST_SIZE]
+
+    def add(self, content_hash):
+        ''' Add a hash unless it is in the set. Returns whether it was added,
+        so concurrent checks of the same page agree on one winner. '''
+        digest = self._digest(content_hash)
+        with self.lock:
+            if digest in self.hashes:
+                return False
+            self.hashes.add(digest)
+            self.count += 1
+            if self.log:
+                self.log.append(digest)
+        return True
+
+    def __contains__(self, content_hash):
+        return self._digest(content_hash) in self.hashes
+
+    def __len__(self):
+        return self.count
+
+    def take(self, mark):
+        ''' Unwritten hashes among the first `mark` added. '''
+        return self.log.take(mark) if self.log else b""
+
+    def untake(self, data):
+        if self.log:
+            self.log.untake(data)
+
+    def write(self, data):
+        if self.log:
+            self.log.write(data)
+
+    def close(self):
+        if self.log:
+            self.log.close()
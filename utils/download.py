@@ -2,16 +2,96 @@ import requests
 import cbor
 import time
 
+from threading import local
+
 from utils.response import Response
 
+# Size of the argument after a CBOR item head, by its additional info, and
+# the simple values, see decode.
+CBOR_SIZES = {24: 1, 25: 2, 26: 4, 27: 8}
+CBOR_SIMPLE = {0xf4: False, 0xf5: True, 0xf6: None}
+
+# A requests.Session per thread, so each worker keeps its connection to
+# the cache server alive instead of opening one per download.
+_sessions = local()
+
+class _Unsupported(Exception):
+    pass
+
+def _session():
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    return session
+
+def _head(view, pos):
+    ''' (major type, argument, position after the head) of a CBOR item. '''
+    if pos >= len(view):
+        raise EOFError("Truncated CBOR.")
+    major, info = view[pos] >> 5, view[pos] & 0x1f
+    pos += 1
+    if info < 24:
+        return major, info, pos
+    size = CBOR_SIZES.get(info)
+    if size is None or major == 7:
+        # Indefinite lengths and floats.
+        raise _Unsupported()
+    if pos + size > len(view):
+        raise EOFError("Truncated CBOR.")
+    return major, int.from_bytes(view[pos:pos + size], "big"), pos + size
+
+def _item(view, pos):
+    if pos < len(view) and view[pos] in CBOR_SIMPLE:
+        return CBOR_SIMPLE[view[pos]], pos + 1
+    major, value, pos = _head(view, pos)
+    if major == 0:
+        return value, pos
+    if major == 1:
+        return -1 - value, pos
+    if major in (2, 3):
+        end = pos + value
+        if end > len(view):
+            raise EOFError("Truncated CBOR.")
+        if major == 2:
+            return view[pos:end], end
+        return str(view[pos:end], "utf-8"), end
+    raise _Unsupported()
+
+def decode(body):
+    ''' The CBOR map the cache server sends. Its byte strings, the pickled
+    page among them, are memoryviews into body instead of copies. Anything
+    but a flat map with text keys goes through cbor.loads. '''
+    view = memoryview(body)
+    try:
+        major, count, pos = _head(view, 0)
+        if major != 5:
+            raise _Unsupported()
+        resp_dict = dict()
+        for _ in range(count):
+            key, pos = _item(view, pos)
+            if not isinstance(key, str):
+                raise _Unsupported()
+            resp_dict[key], pos = _item(view, pos)
+        return resp_dict
+    except _Unsupported:
+        return cbor.loads(bytes(body))
+
 def download(url, config, logger=None):
     host, port = config.cache_server
-    resp = requests.get(
+    resp = _session().get(
         f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+        params=[("q", f"{url}"), ("u", f"{config.user_agent}")], stream=True)
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        # One read of the whole body, where resp.content would join it
+        # from 10kB chunks.
+        content = resp.raw.read(decode_content=True)
+    except Exception:
+        resp.close()
+        raise
+    resp.raw.release_conn()
+    try:
+        if resp and content:
+            return Response(decode(content))
     except (EOFError, ValueError) as e:
         pass
     logger.error(f"Spacetime Response error {resp} with url {url}.")
@@ -19,3 +99,23 @@ def download(url, config, logger=None):
         "error": f"Spacetime Response error {resp} with url {url}.",
         "status": resp.status_code,
         "url": url})
+
+async def download_async(url, config, session, logger=None):
+    ''' download() for the asyncio engine. `session` is an
+    aiohttp.ClientSession whose connector pools the keep-alive
+    connections to the cache server. '''
+    host, port = config.cache_server
+    async with session.get(
+            f"http://{host}:{port}/",
+            params=[("q", f"{url}"), ("u", f"{config.user_agent}")]) as resp:
+        content = await resp.read()
+    try:
+        if resp.ok and content:
+            return Response(decode(content))
+    except (EOFError, ValueError) as e:
+        pass
+    logger.error(f"Spacetime Response error <{resp.status}> with url {url}.")
+    return Response({
+        "error": f"Spacetime Response error <{resp.status}> with url {url}.",
+        "status": resp.status,
+        "url": url})
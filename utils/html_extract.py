@@ -0,0 +1,100 @@
+from collections import namedtuple
+
+from bs4.dammit import EncodingDetector
+from lxml import etree
+
+ExtractedPage = namedtuple("ExtractedPage", ["nofollow", "text", "hrefs"])
+
+# Strings inside these tags are not text to BeautifulSoup's get_text().
+HIDDEN_TEXT_TAGS = {"rt", "rp", "style", "script", "template"}
+PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+
+class _NoFollow(Exception):
+    pass
+
+
+class _ExtractTarget(object):
+    ''' lxml parser target that collects what the scraper used to read from
+    a BeautifulSoup tree: the first robots meta tag, the get_text() string
+    and every <a href>. Text is grouped and whitespace-collapsed exactly
+    like BeautifulSoup.endData so the output matches soup.get_text(). '''
+
+    def __init__(self):
+        self.text = list()
+        self.pending = list()
+        self.hrefs = list()
+        self.hidden = 0
+        self.preserve = 0
+        self.robots_seen = False
+
+    def _end_data(self):
+        if not self.pending:
+            return
+        data = "".join(self.pending)
+        self.pending = list()
+        if not self.preserve and not data.strip(ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+        if not self.hidden:
+            self.text.append(data)
+
+    def start(self, tag, attrib, nsmap=None):
+        self._end_data()
+        if tag == "meta" and not self.robots_seen and attrib.get("name") == "robots":
+            self.robots_seen = True
+            content = attrib.get("content")
+            if content is not None and "nofollow" in content.split(","):
+                # Nothing else on the page is needed.
+                raise _NoFollow()
+        elif tag == "a" and "href" in attrib:
+            self.hrefs.append(attrib["href"])
+        if tag in HIDDEN_TEXT_TAGS:
+            self.hidden += 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve += 1
+
+    def end(self, tag):
+        self._end_data()
+        if tag in HIDDEN_TEXT_TAGS:
+            self.hidden -= 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve -= 1
+
+    def data(self, data):
+        self.pending.append(data)
+
+    # Comments, processing instructions and doctypes end the current
+    # string but are not text themselves.
+    def comment(self, text):
+        self._end_data()
+
+    def pi(self, target, data):
+        self._end_data()
+
+    def doctype(self, name, pubid, system):
+        self._end_data()
+
+    def close(self):
+        self._end_data()
+        return ExtractedPage(False, "".join(self.text), self.hrefs)
+
+
+def extract(html):
+    ''' Single pass over raw html without building a tree. Returns an
+    ExtractedPage; text and hrefs are None when the robots meta tag says
+    nofollow, since parsing stops there. '''
+    # Try encodings in the order BeautifulSoup's lxml builder does.
+    detector = EncodingDetector(html, is_html=True)
+    error = None
+    for encoding in detector.encodings:
+        try:
+            parser = etree.HTMLParser(
+                target=_ExtractTarget(), recover=True, encoding=encoding)
+            parser.feed(detector.markup)
+            return parser.close()
+        except _NoFollow:
+            return ExtractedPage(True, None, None)
+        except (UnicodeDecodeError, LookupError, etree.ParserError) as e:
+            error = e
+    raise ValueError(f"Could not parse page: {error}")
@@ -0,0 +1,217 @@
+import json
+import os
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock, Event, local
+
+# Timer histograms use power of two buckets in microseconds: bucket b
+# holds durations in [2**(b-1), 2**b) us. 32 buckets reach about 35 min.
+BUCKETS = 32
+PERCENTILES = (50, 95, 99)
+
+
+class _Shard(object):
+    ''' Counters and timers written by one thread only. '''
+
+    def __init__(self):
+        self.counters = dict()
+        # name -> [count, total seconds, max seconds, buckets]
+        self.timers = dict()
+
+
+class _Timer(object):
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+class Metrics(object):
+    ''' In-process metrics registry.
+
+    Every thread writes to its own shard, so counting and timing take no
+    lock; snapshot() merges the shards. Gauges are callables evaluated
+    only when a snapshot is taken.
+    '''
+
+    def __init__(self):
+        self.local = local()
+        self.lock = Lock()
+        self.shards = list()
+        self.gauges = dict()
+        self.started = time.monotonic()
+
+    def _shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = _Shard()
+            with self.lock:
+                self.shards.append(shard)
+            return shard
+
+    def count(self, name, value=1):
+        counters = self._shard().counters
+        counters[name] = counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        timers = self._shard().timers
+        timer = timers.get(name)
+        if timer is None:
+            timer = timers[name] = [0, 0.0, 0.0, [0] * BUCKETS]
+        timer[0] += 1
+        timer[1] += seconds
+        if seconds > timer[2]:
+            timer[2] = seconds
+        timer[3][min(int(seconds * 1e6).bit_length(), BUCKETS - 1)] += 1
+
+    def timer(self, name):
+        ''' Context manager that records the time spent in its block. '''
+        return _Timer(self, name)
+
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    def snapshot(self):
+        counters = dict()
+        timers = dict()
+        with self.lock:
+            shards = list(self.shards)
+        for shard in shards:
+            # Copying a dict is atomic under the GIL, so the owning thread
+            # can keep writing while it is read.
+            for name, value in list(shard.counters.items()):
+                counters[name] = counters.get(name, 0) + value
+            for name, (count, total, longest, buckets) in list(shard.timers.items()):
+                merged = timers.setdefault(name, [0, 0.0, 0.0, [0] * BUCKETS])
+                merged[0] += count
+                merged[1] += total
+                merged[2] = max(merged[2], longest)
+                for bucket, bucket_count in enumerate(list(buckets)):
+                    merged[3][bucket] += bucket_count
+        gauges = dict()
+        for name, read in list(self.gauges.items()):
+            try:
+                gauges[name] = read()
+            except Exception as e:
+                gauges[name] = f"error: {e}"
+        return {
+            "time": time.time(),
+            "uptime": time.monotonic() - self.started,
+            "counters": counters,
+            "timers": {
+                name: _summarize(*timer) for name, timer in timers.items()},
+            "gauges": gauges}
+
+
+def _summarize(count, total, longest, buckets):
+    summary = {
+        "count": count, "total": total, "max": longest,
+        "mean": total / count if count else 0.0}
+    for percentile in PERCENTILES:
+        rank = count * percentile / 100
+        seen = 0
+        for bucket, bucket_count in enumerate(buckets):
+            seen += bucket_count
+            if seen >= rank:
+                # Upper bound of the bucket, capped by the longest seen.
+                summary[f"p{percentile}"] = min((1 << bucket) / 1e6, longest)
+                break
+    return summary
+
+
+class MetricsReporter(object):
+    ''' Publishes snapshots of a registry every `interval` seconds to a
+    JSON file, and on demand over HTTP at http://127.0.0.1:<port>/.
+    Adds a "rates" section with per second rates of every counter since
+    the previous snapshot, e.g. rates["pages"] for pages per second. '''
+
+    def __init__(self, metrics, interval, path=None, port=0, logger=None):
+        self.metrics = metrics
+        self.interval = interval
+        self.path = path
+        self.logger = logger
+        self.last = None
+        self.lock = Lock()
+        self.stopped = Event()
+        self.server = None
+        if port:
+            self.server = ThreadingHTTPServer(
+                ("127.0.0.1", port), _handler(self))
+            Thread(target=self.server.serve_forever, daemon=True).start()
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def snapshot(self):
+        snapshot = self.metrics.snapshot()
+        with self.lock:
+            last, self.last = self.last, snapshot
+        if last is None:
+            elapsed, previous = snapshot["uptime"], dict()
+        else:
+            elapsed = snapshot["uptime"] - last["uptime"]
+            previous = last["counters"]
+        snapshot["rates"] = {
+            name: (value - previous.get(name, 0)) / elapsed if elapsed else 0.0
+            for name, value in snapshot["counters"].items()}
+        return snapshot
+
+    def write(self):
+        if not self.path:
+            return
+        snapshot = self.snapshot()
+        with open(f"{self.path}.tmp", "w") as metrics_file:
+            json.dump(snapshot, metrics_file, indent=1, sort_keys=True)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                if self.logger:
+                    self.logger.error(f"Could not write metrics: {e}")
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.write()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def _handler(reporter):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(reporter.snapshot(), sort_keys=True).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+
+# Shared registry for the whole process.
+metrics = Metrics()
+
+
+def start_reporter(config, logger=None):
+    ''' Start a reporter for the shared registry if the config asks for
+    one, otherwise return None. '''
+    if not config.metrics_file and not config.metrics_port:
+        return None
+    return MetricsReporter(
+        metrics, config.metrics_interval, config.metrics_file,
+        config.metrics_port, logger)
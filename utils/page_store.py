@@ -0,0 +1,193 @@
+import os
+import mmap
+import struct
+import zlib
+
+from threading import Lock
+
+from utils import get_urlhash
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Every record in a segment: codec, url length and data length, then the
+# url and the (compressed) html.
+RECORD = struct.Struct("<BHI")
+# Every entry of the index: url digest, segment number, record offset and
+# record length.
+ENTRY = struct.Struct("<16sIQI")
+DIGEST_SIZE = 16
+CODECS = {"none": 0, "zlib": 1, "zstd": 2}
+INDEX_FILE = "pages.index"
+
+
+def segment_path(directory, segment):
+    return os.path.join(directory, f"pages-{segment:05d}.seg")
+
+
+def _digest(url):
+    return bytes.fromhex(get_urlhash(url))[:DIGEST_SIZE]
+
+
+def compress(codec, data, level):
+    if codec == CODECS["zlib"]:
+        return zlib.compress(data, 6 if level is None else level)
+    if codec == CODECS["zstd"]:
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    return data
+
+
+def decompress(codec, data):
+    if codec == CODECS["zlib"]:
+        return zlib.decompress(data)
+    if codec == CODECS["zstd"]:
+        return zstandard.ZstdDecompressor().decompress(data)
+    return bytes(data)
+
+
+def decode_record(view):
+    ''' (url, html) of the record at the start of a buffer. Only the
+    decompressed html is copied out of it. '''
+    codec, url_length, data_length = RECORD.unpack_from(view)
+    start = RECORD.size + url_length
+    url = bytes(view[RECORD.size:start]).decode("utf-8")
+    return url, decompress(codec, view[start:start + data_length])
+
+
+class SegmentReader(object):
+    ''' Read-only mmaps of the segments in a directory, remapped when a
+    segment has grown past the mapped size. '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.maps = dict()
+
+    def read(self, segment, offset, length):
+        ''' (url, html) of one record. '''
+        pages = self.maps.get(segment)
+        if pages is None or len(pages) < offset + length:
+            if pages is not None:
+                pages.close()
+            with open(segment_path(self.directory, segment), "rb") as file:
+                pages = self.maps[segment] = mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ)
+        with memoryview(pages) as view:
+            return decode_record(view[offset:offset + length])
+
+    def close(self):
+        for pages in self.maps.values():
+            pages.close()
+        self.maps.clear()
+
+
+class PageStore(object):
+    ''' Append-only store of downloaded html, for reprocessing a crawl
+    without downloading it again.
+
+    Pages are compressed one by one (zlib, zstd if the zstandard package
+    is installed, or none) and appended to segment files of about
+    `segment_size` bytes. An index file maps the first 16 bytes of each
+    url's urlhash to (segment, offset, length), and is written after the
+    record, so a crash at worst leaves a record nothing points to; index
+    entries past the end of their segment are dropped on load. A url that
+    is stored again (a recrawl) points to its newest copy. Reads go
+    through mmap.
+    '''
+
+    def __init__(self, directory, compression="zlib", segment_size=256 << 20,
+                 level=None):
+        if compression not in CODECS:
+            raise ValueError(
+                f"Unknown page compression {compression}, "
+                f"expected one of {', '.join(CODECS)}.")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd page compression needs the zstandard package.")
+        self.directory = directory
+        self.codec = CODECS[compression]
+        self.level = level
+        self.segment_size = segment_size
+        self.lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+        # digest -> (segment, offset, length), oldest record first.
+        self.index = dict()
+        self._load()
+        self.segment = max(
+            (location[0] for location in self.index.values()), default=0)
+        self.segment_file = open(segment_path(directory, self.segment), "ab")
+        self.index_file = open(os.path.join(directory, INDEX_FILE), "ab")
+        self.reader = SegmentReader(directory)
+
+    def _load(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as index_file:
+            data = index_file.read()
+        whole = len(data) - len(data) % ENTRY.size
+        if whole < len(data):
+            # Cut a torn trailing entry, so new entries stay aligned.
+            with open(path, "r+b") as index_file:
+                index_file.truncate(whole)
+        sizes = dict()
+        for offset in range(0, whole, ENTRY.size):
+            digest, segment, record, length = ENTRY.unpack_from(data, offset)
+            if segment not in sizes:
+                segment_file = segment_path(self.directory, segment)
+                sizes[segment] = (
+                    os.path.getsize(segment_file)
+                    if os.path.exists(segment_file) else 0)
+            if record + length > sizes[segment]:
+                continue
+            self.index.pop(digest, None)
+            self.index[digest] = (segment, record, length)
+
+    def put(self, url, html):
+        data = compress(self.codec, html, self.level)
+        encoded_url = url.encode("utf-8")
+        record = RECORD.pack(self.codec, len(encoded_url), len(data))
+        length = len(record) + len(encoded_url) + len(data)
+        digest = _digest(url)
+        with self.lock:
+            offset = self.segment_file.tell()
+            if offset and offset + length > self.segment_size:
+                self.segment_file.close()
+                self.segment += 1
+                self.segment_file = open(
+                    segment_path(self.directory, self.segment), "ab")
+                offset = self.segment_file.tell()
+            self.segment_file.write(record)
+            self.segment_file.write(encoded_url)
+            self.segment_file.write(data)
+            self.segment_file.flush()
+            self.index_file.write(ENTRY.pack(digest, self.segment, offset, length))
+            self.index_file.flush()
+            self.index.pop(digest, None)
+            self.index[digest] = (self.segment, offset, length)
+
+    def get(self, url):
+        ''' Stored html of a url, or None. '''
+        with self.lock:
+            location = self.index.get(_digest(url))
+            if location is None:
+                return None
+            return self.reader.read(*location)[1]
+
+    def __contains__(self, url):
+        return _digest(url) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def locations(self):
+        ''' (segment, offset, length) of the newest copy of every page, in
+        the order they were stored. Read them with a SegmentReader. '''
+        with self.lock:
+            return list(self.index.values())
+
+    def close(self):
+        with self.lock:
+            self.segment_file.close()
+            self.index_file.close()
+            self.reader.close()
@@ -1,14 +1,26 @@
 import pickle
 
 class Response(object):
+    ''' A cache server response. raw_response, the pickled
+    requests.Response, is only unpickled when it is first used, which the
+    crawler only does for status 200. The pickle may be a memoryview into
+    the downloaded body (see utils.download.decode), which is released
+    once it is unpickled. '''
+
     def __init__(self, resp_dict):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        self._pickled = resp_dict.get("response")
+        self._raw_response = None
+
+    @property
+    def raw_response(self):
+        pickled = self._pickled
+        if pickled is not None:
+            try:
+                self._raw_response = pickle.loads(pickled)
+            except TypeError:
+                self._raw_response = None
+            self._pickled = None
+        return self._raw_response
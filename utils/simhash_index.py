@@ -0,0 +1,131 @@
+from array import array
+from math import ceil
+from threading import Thread, Lock, Event
+
+from utils.append_log import AppendLog
+
+# Locks that add_new() takes, by band value.
+STRIPES = 64
+
+
+class SimhashIndex(object):
+    ''' Near-duplicate lookup over 64-bit SimHash fingerprints.
+
+    A page is a near duplicate when distance / len(bin(value)) < threshold,
+    the same rule the scraper always used. That bounds the Hamming distance
+    to a small k, so the fingerprint is split into k + 1 bands: any match
+    agrees exactly on at least one band and only that band's bucket has to
+    be scanned.
+
+    With a `path`, fingerprints are kept in an AppendLog so a resumed
+    crawl reloads the index instead of starting with an empty one. The
+    owner writes them with take() and write(), see Frontier. The index
+    is rebuilt in a background thread; lookups and adds wait for it.
+
+    add_new() checks and adds in one step. It locks one of STRIPES locks
+    per band value of the fingerprint rather than the whole index: two
+    near duplicates agree on a band, so they always share a stripe, while
+    unrelated pages rarely wait for each other.
+    '''
+
+    def __init__(self, path=None, threshold=0.025, bits=64):
+        self.threshold = threshold
+        self.bits = bits
+        # len(bin(value)) is at most bits + 2 because of the '0b' prefix.
+        self.max_distance = max(ceil(threshold * (bits + 2)) - 1, 0)
+        self.band_count = self.max_distance + 1
+        self.band_width = -(-bits // self.band_count)
+        self.band_mask = (1 << self.band_width) - 1
+        self.tables = [dict() for _ in range(self.band_count)]
+        self.count = 0
+        self.lock = Lock()
+        self.stripes = [Lock() for _ in range(STRIPES)]
+        self.loaded = Event()
+        self.log = None
+        if path:
+            self.log = AppendLog(path, array("Q").itemsize)
+            values = array("Q")
+            values.frombytes(self.log.records())
+            self.count = len(values)
+            Thread(target=self._load, args=(values,), daemon=True).start()
+        else:
+            self.loaded.set()
+
+    def _bands(self, value):
+        for band in range(self.band_count):
+            yield band, (value >> (band * self.band_width)) & self.band_mask
+
+    def _insert(self, value):
+        for band, key in self._bands(value):
+            self.tables[band].setdefault(key, []).append(value)
+        self.count += 1
+
+    def _load(self, values):
+        # One pass per band, which is several times faster than _insert.
+        mask = self.band_mask
+        for band, table in enumerate(self.tables):
+            shift = band * self.band_width
+            get = table.get
+            for value in values:
+                key = (value >> shift) & mask
+                bucket = get(key)
+                if bucket is None:
+                    table[key] = [value]
+                else:
+                    bucket.append(value)
+        self.loaded.set()
+
+    def find_near(self, value):
+        ''' Return a stored fingerprint within the threshold, or None. '''
+        self.loaded.wait()
+        limit = self.threshold * len(bin(value))
+        for band, key in self._bands(value):
+            for candidate in self.tables[band].get(key, ()):
+                if (value ^ candidate).bit_count() < limit:
+                    return candidate
+        return None
+
+    def add(self, value):
+        self.loaded.wait()
+        with self.lock:
+            self._insert(value)
+            if self.log:
+                self.log.append(array("Q", [value]).tobytes())
+
+    def add_new(self, value):
+        ''' Add a fingerprint unless a near one is stored. Returns whether
+        it was added. '''
+        self.loaded.wait()
+        stripes = sorted({hash(band) % STRIPES for band in self._bands(value)})
+        for stripe in stripes:
+            self.stripes[stripe].acquire()
+        try:
+            if self.find_near(value) is not None:
+                return False
+            self.add(value)
+            return True
+        finally:
+            for stripe in reversed(stripes):
+                self.stripes[stripe].release()
+
+    def take(self, mark):
+        ''' Unwritten fingerprints among the first `mark` added. '''
+        return self.log.take(mark) if self.log else b""
+
+    def untake(self, data):
+        if self.log:
+            self.log.untake(data)
+
+    def write(self, data):
+        if self.log:
+            self.log.write(data)
+
+    def __contains__(self, value):
+        return self.find_near(value) is not None
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self.log:
+            self.log.close()
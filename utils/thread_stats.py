@@ -0,0 +1,113 @@
+from collections import Counter
+from threading import Lock, local
+
+
+class _Buffer(object):
+    def __init__(self):
+        self.lock = Lock()
+        self.counts = Counter()
+        self.adds = 0
+
+
+class LocalCounter(object):
+    ''' Counts that many threads add to without sharing a lock.
+
+    Every thread counts into its own Counter, behind a lock that only it
+    and merge() take, and hands its counts to `sink` every `batch` adds.
+    merge() hands over the counts of every thread, so readers of whatever
+    `sink` feeds call it first. `sink` is called from any thread.
+    '''
+
+    def __init__(self, sink, batch=100):
+        self.sink = sink
+        self.batch = batch
+        self.local = local()
+        self.lock = Lock()
+        self.buffers = list()
+
+    def _buffer(self):
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is None:
+            buffer = self.local.buffer = _Buffer()
+            with self.lock:
+                self.buffers.append(buffer)
+        return buffer
+
+    def add(self, key, count=1):
+        buffer = self._buffer()
+        with buffer.lock:
+            buffer.counts[key] += count
+            buffer.adds += 1
+            full = buffer.adds >= self.batch
+        if full:
+            self._drain(buffer)
+
+    def update(self, counts):
+        buffer = self._buffer()
+        with buffer.lock:
+            buffer.counts.update(counts)
+            buffer.adds += 1
+            full = buffer.adds >= self.batch
+        if full:
+            self._drain(buffer)
+
+    def merge(self):
+        with self.lock:
+            buffers = list(self.buffers)
+        for buffer in buffers:
+            self._drain(buffer)
+
+    def _drain(self, buffer):
+        with buffer.lock:
+            counts, buffer.counts = buffer.counts, Counter()
+            buffer.adds = 0
+        if counts:
+            self.sink(counts)
+
+
+class Tally(object):
+    ''' Counts by key, added to from many threads through a LocalCounter. '''
+
+    def __init__(self, counts=None, batch=100):
+        self.lock = Lock()
+        self.total = Counter(counts or {})
+        self.local = LocalCounter(self._sink, batch)
+
+    def _sink(self, counts):
+        with self.lock:
+            self.total.update(counts)
+
+    def add(self, key, count=1):
+        self.local.add(key, count)
+
+    def counts(self):
+        ''' Every count so far, as a dict. '''
+        self.local.merge()
+        with self.lock:
+            return dict(self.total)
+
+
+class Longest(object):
+    ''' The url with the highest count offered, e.g. the longest page.
+    Every thread keeps its own best, so offers take no shared lock. '''
+
+    def __init__(self, count=0, url=""):
+        self.local = local()
+        self.lock = Lock()
+        # One [(count, url)] per thread, replaced whole so reads are safe.
+        self.bests = [[(count, url)]]
+
+    def offer(self, url, count):
+        best = getattr(self.local, "best", None)
+        if best is None:
+            best = self.local.best = [(0, "")]
+            with self.lock:
+                self.bests.append(best)
+        if count > best[0][0]:
+            best[0] = (count, url)
+
+    def value(self):
+        ''' (count, url) of the best offer. '''
+        with self.lock:
+            bests = [best[0] for best in self.bests]
+        return max(bests, key=lambda best: best[0])
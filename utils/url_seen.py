@@ -0,0 +1,163 @@
+import os
+import mmap
+import struct
+
+HEADER = struct.Struct("<8sQQQ")
+MAGIC = b"URLSEEN1"
+DIGEST_SIZE = 16
+EMPTY_SLOT = bytes(DIGEST_SIZE)
+BLOOM_BITS_PER_SLOT = 10
+BLOOM_HASHES = 7
+MAX_LOAD = 0.7
+
+
+class UrlSeenSet(object):
+    ''' Set of url hashes kept in a memory-mapped file.
+
+    Each url is stored as the first 16 bytes of its sha256 urlhash in an
+    open-addressing table (linear probing), about 24 bytes per url with
+    the Bloom filter instead of a Python string per url. A url that was
+    never added almost always misses in the Bloom filter, which answers
+    without probing the table. The table doubles past 70% load.
+
+    The file records whether it was closed cleanly. After a crash it may
+    hold urls whose save file rows were never flushed, so the frontier
+    rebuilds it from the save file (see `dirty`).
+    '''
+
+    def __init__(self, path, capacity=1 << 16):
+        self.path = path
+        self.file = None
+        self.map = None
+        if os.path.exists(path) and os.path.getsize(path) >= HEADER.size:
+            self._open()
+            self.dirty = self.dirty or self.magic != MAGIC
+        else:
+            self._create(path, capacity)
+            self._open()
+            self.dirty = False
+        self._write_header(dirty=True)
+
+    def _create(self, path, capacity):
+        bloom_size = capacity * BLOOM_BITS_PER_SLOT // 8
+        with open(path, "wb") as seen_file:
+            seen_file.write(HEADER.pack(MAGIC, capacity, 0, 0))
+            seen_file.truncate(HEADER.size + bloom_size + capacity * DIGEST_SIZE)
+
+    def _open(self):
+        self.file = open(self.path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.magic, self.capacity, self.count, dirty = HEADER.unpack_from(self.map)
+        self.dirty = bool(dirty)
+        self.bloom_bits = self.capacity * BLOOM_BITS_PER_SLOT
+        self.table_offset = HEADER.size + self.bloom_bits // 8
+
+    def _write_header(self, dirty):
+        HEADER.pack_into(
+            self.map, 0, MAGIC, self.capacity, self.count, int(dirty))
+
+    def _close_map(self):
+        self.map.close()
+        self.file.close()
+        self.map = self.file = None
+
+    @staticmethod
+    def _digest(urlhash):
+        digest = bytes.fromhex(urlhash)[:DIGEST_SIZE]
+        # All zero bytes mark an empty slot.
+        return digest if digest != EMPTY_SLOT else b"\x01" + digest[1:]
+
+    def _bloom_positions(self, digest):
+        # Double hashing over the two halves of an already uniform digest.
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(BLOOM_HASHES):
+            yield (first + i * second) % self.bloom_bits
+
+    def _bloom_contains(self, digest):
+        for position in self._bloom_positions(digest):
+            if not self.map[HEADER.size + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def _bloom_add(self, digest):
+        for position in self._bloom_positions(digest):
+            offset = HEADER.size + (position >> 3)
+            self.map[offset] |= 1 << (position & 7)
+
+    def _find_slot(self, digest):
+        ''' Offset of the slot holding digest, or of the empty slot where
+        it would go. '''
+        mask = self.capacity - 1
+        slot = int.from_bytes(digest[:8], "little") & mask
+        while True:
+            offset = self.table_offset + slot * DIGEST_SIZE
+            stored = self.map[offset:offset + DIGEST_SIZE]
+            if stored == digest or stored == EMPTY_SLOT:
+                return offset, stored == digest
+            slot = (slot + 1) & mask
+
+    def _insert(self, digest):
+        offset, found = self._find_slot(digest)
+        if found:
+            return False
+        self.map[offset:offset + DIGEST_SIZE] = digest
+        self._bloom_add(digest)
+        self.count += 1
+        return True
+
+    def __contains__(self, urlhash):
+        digest = self._digest(urlhash)
+        if not self._bloom_contains(digest):
+            return False
+        return self._find_slot(digest)[1]
+
+    def add(self, urlhash):
+        ''' Add a url hash. Returns True if it was not in the set. '''
+        digest = self._digest(urlhash)
+        if self._bloom_contains(digest) and self._find_slot(digest)[1]:
+            return False
+        if (self.count + 1) > self.capacity * MAX_LOAD:
+            self._resize(self.capacity * 2)
+        self._insert(digest)
+        return True
+
+    def _digests(self):
+        for slot in range(self.capacity):
+            offset = self.table_offset + slot * DIGEST_SIZE
+            digest = self.map[offset:offset + DIGEST_SIZE]
+            if digest != EMPTY_SLOT:
+                yield digest
+
+    def _resize(self, capacity):
+        ''' Rehash into a file with the new capacity and swap it in. '''
+        digests = list(self._digests())
+        self._close_map()
+        tmp_path = f"{self.path}.tmp"
+        self._create(tmp_path, capacity)
+        os.replace(tmp_path, self.path)
+        self._open()
+        for digest in digests:
+            self._insert(digest)
+        self._write_header(dirty=True)
+
+    def rebuild(self, urlhashes):
+        ''' Replace the contents with urlhashes, e.g. the save file's keys. '''
+        self._close_map()
+        os.remove(self.path)
+        self._create(self.path, 1 << 16)
+        self._open()
+        for urlhash in urlhashes:
+            self.add(urlhash)
+        self.dirty = False
+        self._write_header(dirty=True)
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self.map is None:
+            return
+        self._write_header(dirty=False)
+        self.map.flush()
+        self._close_map()
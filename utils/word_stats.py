@@ -0,0 +1,118 @@
+import heapq
+
+from operator import itemgetter
+from threading import Lock
+
+from utils.thread_stats import LocalCounter
+
+
+class WordStats(object):
+    ''' Word counts with a memory budget and a continuously kept top K.
+
+    Counts are exact until more than `capacity` distinct words have been
+    seen. Past that, the quarter of words with the lowest counts is
+    dropped (Space-Saving style): `floor` remembers the highest count
+    dropped, and a word seen again starts from that floor. A reported
+    count is then an upper bound that is at most `floor` too high, and
+    every word whose true count exceeds `floor` is still tracked.
+
+    The K best (count, word) pairs are updated on every increment, so the
+    report never has to sort the whole table.
+
+    update() counts into a Counter of the calling thread, which is merged
+    into the table every `batch` pages (see LocalCounter), so threads do
+    not wait for each other and a word is tracked once per batch instead
+    of once per page. Readers merge every thread's counts first.
+    '''
+
+    def __init__(self, capacity=200000, top_k=50, batch=100):
+        self.capacity = capacity
+        self.top_k = top_k
+        self.lock = Lock()
+        self.counts = dict()
+        self.floor = 0
+        self.top = dict()
+        self.weakest = None
+        self.local = LocalCounter(self._update, batch)
+
+    @staticmethod
+    def _rank(word, count):
+        # Higher counts first, then alphabetical, like the original report.
+        return (-count, word)
+
+    def update(self, word_freq):
+        self.local.update(word_freq)
+
+    def merge(self):
+        ''' Merge the counts every thread has buffered into the table. '''
+        self.local.merge()
+
+    def _update(self, word_freq):
+        with self.lock:
+            counts = self.counts
+            for word, count in word_freq.items():
+                count += counts.get(word, self.floor)
+                counts[word] = count
+                self._track(word, count)
+            if len(counts) > self.capacity:
+                self._evict()
+
+    def _track(self, word, count):
+        top = self.top
+        if word in top:
+            top[word] = count
+            if word == self.weakest:
+                self.weakest = None
+        elif len(top) < self.top_k:
+            top[word] = count
+            self.weakest = None
+        else:
+            weakest = self._weakest()
+            if self._rank(word, count) < self._rank(weakest, top[weakest]):
+                del top[weakest]
+                top[word] = count
+                self.weakest = None
+
+    def _weakest(self):
+        if self.weakest is None:
+            self.weakest = max(
+                self.top, key=lambda word: self._rank(word, self.top[word]))
+        return self.weakest
+
+    def _evict(self):
+        evict_count = len(self.counts) - self.capacity * 3 // 4
+        candidates = (
+            item for item in self.counts.items() if item[0] not in self.top)
+        for word, count in heapq.nsmallest(
+                evict_count, candidates, key=itemgetter(1)):
+            del self.counts[word]
+            self.floor = max(self.floor, count)
+
+    def most_common(self, k=None):
+        ''' Top words as (word, count) pairs, best first. '''
+        self.merge()
+        with self.lock:
+            items = sorted(
+                self.top.items(), key=lambda item: self._rank(*item))
+        return items[:k]
+
+    def items(self):
+        ''' Every tracked (word, count) pair. '''
+        self.merge()
+        with self.lock:
+            return list(self.counts.items())
+
+    def __len__(self):
+        return len(self.counts)
+
+    def state(self):
+        ''' A copy of the table to checkpoint, see restore(). '''
+        self.merge()
+        with self.lock:
+            return dict(self.counts), self.floor, dict(self.top)
+
+    def restore(self, state):
+        # Older checkpoints also held an unused total before the top words.
+        with self.lock:
+            self.counts, self.floor, self.top = state[0], state[1], state[-1]
+            self.weakest = None